@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for intent detection on Bangla/Banglish customer messages.
+Compares the original per-pattern re.search loop, a loop over precompiled patterns
+and the single-pass IntentMatcher, and checks that the single pass scores every
+message exactly like the precompiled loop. The greeting keyword check is timed too.
+
+    python benchmark_intent_detector.py --repeat 200
+"""
+
+import argparse
+import re
+import time
+
+from services.fast_responder import GREETING_KEYWORDS, GREETING_REGEX
+from services.intent_detector import compile_intent_pattern, intent_detector
+
+CORPUS = [
+    "pp", "PP", "price?", "dam koto", "দাম কত?", "এটার দাম কত টাকা", "প্রাইস কত", "koto taka",
+    "আসসালামু আলাইকুম", "assalamu alaiikum", "salam vai", "hi", "hello", "কেমন আছেন?",
+    "delivery charge koto", "ডেলিভারি চার্জ কত?", "ঢাকার বাইরে ডেলিভারি কতদিনে পৌঁছাবে",
+    "কবে পাব?", "narayanganj e delivery hobe?", "courier kon ta",
+    "order korte chai", "অর্ডার করতে চাই", "আমি এটা নিতে চাই", "kivabe kinbo",
+    "01712345678 dhanmondi", "চাষাড়া, ০১৭১২৩৪৫৬৭৮", "confirm korlam",
+    "size chart din", "সাইজ চার্ট দেন", "আমার পায়ের সাইজ 38 bata", "কোন সাইজ ফিট হবে?",
+    "apex 40 hobe?", "শু সাইজ কিভাবে বুঝব",
+    "return policy ki", "রিটার্ন করা যাবে?", "পছন্দ না হলে ফেরত দেওয়া যাবে?", "exchange kora jabe",
+    "image dekhte chai", "ছবি দেখান", "আরো ছবি আছে?", "real pic din",
+    "hubohu chobir moto?", "ছবির মতো হবে তো?",
+    "amar order koi", "order kothay", "অর্ডার ট্র্যাক করতে চাই", "order status ki",
+    "dam komano jay kina", "একটু কমানো যায় না?", "dam ta onk beshi", "কিছু ডিসকাউন্ট দেন",
+    "এখনো হাতে পাইনি", "product dite deri hocche", "ভুল ব্যাগ দিয়েছেন", "জুতা ছেঁড়া",
+    "vul product peyechi", "delivery man dite parchhe na",
+    "order cancel korte chai", "অর্ডার ক্যান্সেল করবো", "লাগবে না আর",
+    "লাল রঙের ব্যাগ আছে?", "kon kon color ache", "স্কুল ব্যাগ দেখান", "নতুন কালেকশন কি আছে",
+    "leather er naki", "কোয়ালিটি কেমন?", "brand ki", "কোথা থেকে ইমপোর্ট করা",
+    "ঠিক আছে", "ok", "thanks", "ধন্যবাদ", "👍", "❤️", "😊", ".",
+    "জুতা ডেলিভারি চার্জ কত", "price ar delivery charge soho koto porbe",
+    "এই জুতাটার সাইজ 39 আছে? দাম কত? ঢাকার ভিতরে ডেলিভারি কবে পাব?",
+    "apu ei bag ta nibo, dhaka te delivery koto din lagbe ar cash on delivery to?",
+    "আমার আগের অর্ডারটা এখনো আসেনি, একটু আপডেট দিবেন? নম্বর ০১৮১১১১১১১১",
+]
+
+
+def legacy_scores(message: str):
+    """The original implementation: uncompiled pattern strings, one re.search per pattern"""
+    message_lower = message.lower().strip()
+    scores = {}
+    for intent_type, patterns in intent_detector.intent_patterns.items():
+        score = 0.0
+        for pattern in patterns:
+            if re.search(pattern, message_lower, re.IGNORECASE):
+                score += 0.3 if len(pattern) > 20 else 0.2
+        if score:
+            scores[intent_type] = min(score, 1.0)
+    return scores
+
+
+COMPILED = {
+    intent_type: [(compile_intent_pattern(p), 0.3 if len(p) > 20 else 0.2) for p in patterns]
+    for intent_type, patterns in intent_detector.intent_patterns.items()
+}
+
+
+def compiled_loop_scores(message: str):
+    """Precompiled patterns (with Bangla-aware word boundaries), still one search per pattern"""
+    message_lower = message.lower().strip()
+    scores = {}
+    for intent_type, patterns in COMPILED.items():
+        score = 0.0
+        for regex, weight in patterns:
+            if regex.search(message_lower):
+                score += weight
+        if score:
+            scores[intent_type] = min(score, 1.0)
+    return scores
+
+
+def rounded(scores):
+    return {intent.value: round(score, 6) for intent, score in scores.items()}
+
+
+def check_parity():
+    mismatches = []
+    for message in CORPUS:
+        expected = rounded(compiled_loop_scores(message))
+        actual = rounded(intent_detector.score_intents(message))
+        if expected != actual:
+            mismatches.append((message, expected, actual))
+        if any(k in message.lower() for k in GREETING_KEYWORDS) != bool(GREETING_REGEX.search(message.lower())):
+            mismatches.append((message, "greeting", "greeting"))
+    return mismatches
+
+
+def bench(name: str, func, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in CORPUS:
+            func(message)
+    seconds = time.perf_counter() - started
+    calls = repeat * len(CORPUS)
+    print(f"{name:<28} {seconds * 1e6 / calls:8.1f} us/message  ({calls} messages)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent detector micro-benchmark")
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the corpus")
+    args = parser.parse_args()
+
+    mismatches = check_parity()
+    for message, expected, actual in mismatches:
+        print(f"MISMATCH {message!r}: expected {expected}, got {actual}")
+    print(f"Parity: {len(CORPUS) - len(mismatches)}/{len(CORPUS)} messages identical")
+
+    bench("legacy re.search loop", legacy_scores, args.repeat)
+    bench("precompiled pattern loop", compiled_loop_scores, args.repeat)
+    bench("single-pass matcher", intent_detector.score_intents, args.repeat)
+    bench("greeting any() loop", lambda m: any(k in m.lower() for k in GREETING_KEYWORDS), args.repeat)
+    bench("greeting compiled regex", lambda m: GREETING_REGEX.search(m.lower()), args.repeat)
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
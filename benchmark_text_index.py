@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the product text index.
+Builds the text FAISS index for synthetic catalogues of increasing size and
+compares the legacy FAISS.from_documents path with the batched/streamed stage.
+
+    python benchmark_text_index.py --sizes 1000,10000,100000 --workers 1,4
+"""
+
+import argparse
+import json
+import random
+import time
+
+from config.settings import settings
+from services.text_indexer import build_text_index, create_e5_embeddings, product_text
+
+NAMES = ["Ladies Hand Bag", "Kids School Bag", "Party Clutch", "Leather Sandal", "Sports Shoe",
+         "হ্যান্ড ব্যাগ", "স্কুল ব্যাগ", "লেডিস জুতা", "বাচ্চাদের স্যান্ডেল", "ট্রাভেল ব্যাগ"]
+DESCRIPTIONS = ["Imported from China, premium PU leather", "সাইজ=36,37,38,39,40",
+                "থাইল্যান্ড থেকে ইমপোর্ট করা, ওয়াটারপ্রুফ", "Soft sole, lightweight, daily use",
+                "রঙ: কালো, লাল, খয়েরি", "Zipper pocket, adjustable strap"]
+
+
+def synthetic_products(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for i in range(count):
+        price = rng.randint(450, 3500)
+        yield {
+            "id": i + 1,
+            "name": f"{rng.choice(NAMES)} {i + 1}",
+            "description": f"{rng.choice(DESCRIPTIONS)}. {rng.choice(DESCRIPTIONS)}",
+            "price": float(price),
+            "marginal_price": float(price - rng.randint(50, 200)),
+            "code": f"MK-{i + 1:06d}",
+            "link": f"https://momsandkidsworld.com/product/{i + 1}",
+        }
+
+
+def bench_legacy(count: int):
+    from langchain.docstore.document import Document
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = HuggingFaceEmbeddings(model_name=settings.TEXT_EMBEDDING_MODEL)
+    started = time.perf_counter()
+    documents = [Document(page_content=product_text(p), metadata=p) for p in synthetic_products(count)]
+    FAISS.from_documents(documents, embeddings)
+    return time.perf_counter() - started
+
+
+def bench_stage(count: int, batch_size: int, workers: int):
+    embeddings = create_e5_embeddings(batch_size=batch_size)
+    started = time.perf_counter()
+    build_text_index(synthetic_products(count), embeddings, batch_size=batch_size, workers=workers)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text index throughput benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated catalogue sizes")
+    parser.add_argument("--workers", default="1,4", help="Comma separated encoder process counts")
+    parser.add_argument("--batch-size", type=int, default=settings.TEXT_EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--legacy-max", type=int, default=10000,
+                        help="Largest size to also run the legacy from_documents path on")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    results = []
+
+    for size in sizes:
+        if size <= args.legacy_max:
+            seconds = bench_legacy(size)
+            results.append({"size": size, "mode": "legacy", "workers": 1, "batch_size": 32,
+                            "seconds": round(seconds, 2), "docs_per_s": round(size / seconds, 1)})
+            print(f"{size:>7} products  legacy             {seconds:8.2f}s  {size / seconds:9.1f} docs/s")
+        for workers in worker_counts:
+            seconds = bench_stage(size, args.batch_size, workers)
+            results.append({"size": size, "mode": "stage", "workers": workers, "batch_size": args.batch_size,
+                            "seconds": round(seconds, 2), "docs_per_s": round(size / seconds, 1)})
+            print(f"{size:>7} products  stage w={workers:<2} b={args.batch_size:<4} {seconds:8.2f}s  {size / seconds:9.1f} docs/s")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
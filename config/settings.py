@@ -24,20 +24,106 @@ class Settings:
     # Model Configuration
     CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
     TEXT_EMBEDDING_MODEL = "intfloat/multilingual-e5-small"
+    TEXT_EMBEDDING_BATCH_SIZE = int(os.getenv('TEXT_EMBEDDING_BATCH_SIZE', 64))
+    # Products per streamed chunk when building the text index
+    TEXT_INDEX_CHUNK_SIZE = int(os.getenv('TEXT_INDEX_CHUNK_SIZE', 2048))
+    # Encoder processes for the text index (0 = one per core, up to 4); multi-process
+    # encoding is only worth its start-up cost for larger catalogues
+    TEXT_EMBEDDING_WORKERS = int(os.getenv('TEXT_EMBEDDING_WORKERS', 0))
+    TEXT_MULTIPROCESS_MIN_DOCS = int(os.getenv('TEXT_MULTIPROCESS_MIN_DOCS', 5000))
     
     
     # LLM Configuration
     # Grok / x.ai (OpenAI compatible)
     LLM_MODEL = "grok-4-fast-non-reasoning"
     LLM_API_KEY = os.getenv("LLM_API_KEY")
-    LLM_BASE_URL = "https://api.x.ai/v1"
+    LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.x.ai/v1")
     LLM_MAX_TOKENS = 520
     LLM_TEMPERATURE = 0.5
     
     FALLBACK_LLM_MODEL = "accounts/fireworks/models/deepseek-v3p1-terminus"
     FALLBACK_LLM_API_KEY = os.getenv("FALLBACK_LLM_API_KEY")
-    FALLBACK_LLM_BASE_URL = "https://api.fireworks.ai/inference/v1"
+    FALLBACK_LLM_BASE_URL = os.getenv("FALLBACK_LLM_BASE_URL", "https://api.fireworks.ai/inference/v1")
     
+    # Shared keep-alive HTTP pool used by every LLM client
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', 100))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', 20))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', 60.0))
+    LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', 5.0))
+    LLM_HTTP_TIMEOUT = float(os.getenv('LLM_HTTP_TIMEOUT', 30.0))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 1))
+    
+    # Shared keep-alive HTTP client for the Graph API and attachment downloads
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+    HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', 20))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60.0))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5.0))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 15.0))
+    
+    # LLM routing between primary and fallback
+    LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', 200))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', 3))
+    LLM_CIRCUIT_COOLDOWN = float(os.getenv('LLM_CIRCUIT_COOLDOWN', 60.0))
+    LLM_HEDGING = os.getenv('LLM_HEDGING', 'true').lower() == 'true'
+    # The hedge deadline is the primary's p95 time-to-first-token, clamped to [MIN, MAX];
+    # DEFAULT is used until MIN_SAMPLES latencies have been observed
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+    LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', 4.0))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', 1.0))
+    LLM_HEDGE_MAX_DELAY = float(os.getenv('LLM_HEDGE_MAX_DELAY', 8.0))
+    # LLM metrics are also grouped by prompt version; keep the most recent N versions
+    LLM_METRICS_MAX_LABELS = int(os.getenv('LLM_METRICS_MAX_LABELS', 50))
+    
+    
+    # Messenger webhook: events are acked at once and processed by this many background consumers
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 8))
+    WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv('WEBHOOK_QUEUE_MAX_SIZE', 1000))
+    WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', 20.0))
+    # Messenger image attachments: per-download size cap and timeout, decoded to at most MAX_SIDE pixels
+    ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', 8 * 1024 * 1024))
+    ATTACHMENT_TIMEOUT = float(os.getenv('ATTACHMENT_TIMEOUT', 10.0))
+    ATTACHMENT_IMAGE_MAX_SIDE = int(os.getenv('ATTACHMENT_IMAGE_MAX_SIDE', 1024))
+    # Message ids already handled, to ignore Facebook redeliveries; set the SQLite path to share them between workers
+    WEBHOOK_DEDUP_MAX_ENTRIES = int(os.getenv('WEBHOOK_DEDUP_MAX_ENTRIES', 10000))
+    WEBHOOK_DEDUP_TTL = float(os.getenv('WEBHOOK_DEDUP_TTL', 24 * 3600))
+    WEBHOOK_DEDUP_SQLITE_PATH = os.getenv('WEBHOOK_DEDUP_SQLITE_PATH', '')
+    # Outbound Messenger sends: global rate limit (requests/s, burst) and retries with jittered backoff
+    MESSENGER_SEND_RATE = float(os.getenv('MESSENGER_SEND_RATE', 20.0))
+    MESSENGER_SEND_BURST = float(os.getenv('MESSENGER_SEND_BURST', 40.0))
+    MESSENGER_SEND_MAX_RETRIES = int(os.getenv('MESSENGER_SEND_MAX_RETRIES', 4))
+    MESSENGER_SEND_BACKOFF = float(os.getenv('MESSENGER_SEND_BACKOFF', 0.5))
+    MESSENGER_SEND_BACKOFF_MAX = float(os.getenv('MESSENGER_SEND_BACKOFF_MAX', 10.0))
+    # Messenger: merge a sender's messages arriving within this quiet window into one chat turn (0 = off)
+    WEBHOOK_COALESCE_WINDOW = float(os.getenv('WEBHOOK_COALESCE_WINDOW', 2.0))
+    WEBHOOK_COALESCE_MAX_WAIT = float(os.getenv('WEBHOOK_COALESCE_MAX_WAIT', 6.0))
+    
+    # Chat sessions: least recently used ones are evicted beyond MAX_ENTRIES or after IDLE_TTL seconds
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 5000))
+    SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', 24 * 3600))
+    # "memory" (per worker) or "sqlite" (shared by all workers on this host, needed with --workers > 1)
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory').lower()
+    SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', 'data/sessions.db')
+    
+    # Conversation memory: recent turns verbatim, older ones folded into a rolling summary
+    MEMORY_MAX_TOKENS = int(os.getenv('MEMORY_MAX_TOKENS', 800))
+    MEMORY_RECENT_TURNS = int(os.getenv('MEMORY_RECENT_TURNS', 4))
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv('MEMORY_SUMMARY_MAX_TOKENS', 250))
+    
+    # Answer data-determined questions (price, delivery, size chart, ...) without the LLM
+    FAST_RESPONDER_ENABLED = os.getenv('FAST_RESPONDER_ENABLED', 'true').lower() == 'true'
+    # One keyword scores 0.2-0.3, so 0.5 needs two patterns of the same intent; below it only
+    # the exact phrases in CONFIDENT_PHRASES are answered directly
+    FAST_RESPONDER_MIN_SCORE = float(os.getenv('FAST_RESPONDER_MIN_SCORE', 0.5))
+    
+    # Send only the prompt sections relevant to the detected intents (false = always the full prompt)
+    PROMPT_SECTIONS_ENABLED = os.getenv('PROMPT_SECTIONS_ENABLED', 'true').lower() == 'true'
+    
+    # Response cache for first-turn FAQ-style questions
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 2000))
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 6 * 3600))
+    # Cosine similarity of e5 query embeddings for the semantic tier (0 disables it)
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.93))
     
     # Ollama (uncomment to use)
     # LLM_MODEL = "mistral:latest"
@@ -55,6 +141,27 @@ class Settings:
     PRODUCT_IMAGES_PATH = "product-image"
     PRODUCTS_JSON_PATH = "data/products.json"
     
+    # Index snapshots: training writes each run into its own snapshot directory and
+    # only switches the pointer file once the run has completed
+    SNAPSHOTS_PATH = f"{VECTOR_STORES_PATH}/snapshots"
+    SNAPSHOT_POINTER_PATH = f"{VECTOR_STORES_PATH}/CURRENT"
+    SNAPSHOTS_TO_KEEP = int(os.getenv('SNAPSHOTS_TO_KEEP', 3))
+    # Each worker polls the pointer file and hot-reloads on its own
+    SNAPSHOT_POLL_INTERVAL = float(os.getenv('SNAPSHOT_POLL_INTERVAL', 2.0))
+    WORKER_STATUS_PATH = f"{VECTOR_STORES_PATH}/workers"
+    
+    # Training checkpoints
+    TRAINING_CHECKPOINT_PATH = f"{VECTOR_STORES_PATH}/checkpoint"
+    TRAINING_BATCH_SIZE = int(os.getenv('TRAINING_BATCH_SIZE', 32))
+    # Catalogue images whose CLIP embeddings are at least this similar (cosine) are
+    # collapsed into one vector; byte-identical images are always collapsed
+    IMAGE_DEDUP_SIMILARITY = float(os.getenv('IMAGE_DEDUP_SIMILARITY', 0.97))
+    
+    # Training profiler reports (one JSON per run, older runs kept for comparison)
+    TRAINING_REPORTS_PATH = f"{VECTOR_STORES_PATH}/reports"
+    TRAINING_REPORTS_TO_KEEP = int(os.getenv('TRAINING_REPORTS_TO_KEEP', 50))
+    TRAINING_REPORT_SLOWEST_N = int(os.getenv('TRAINING_REPORT_SLOWEST_N', 10))
+    
     # CORS Configuration
     CORS_ORIGINS = ["*"]
     
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for /api/chat and /api/chat/stream.
+Run the app against mock_llm_server.py to measure throughput, latency and
+fallback behaviour without LLM credits; the router statistics of the worker
+that served the last request are printed at the end.
+
+    python load_test.py --url http://127.0.0.1:8000 --concurrency 20 --requests 500
+    python load_test.py --stream --concurrency 50 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+MESSAGES = [
+    "ব্যাগটার দাম কত?", "এটার দাম কত টাকা", "dam koto", "ডেলিভারি চার্জ কত?", "ঢাকার বাইরে কবে পাব?",
+    "অর্ডার করতে চাই", "আমি এটা নিতে চাই", "size 38 hobe?", "সাইজ চার্ট দেন", "dam komano jay kina",
+    "কোয়ালিটি কেমন?", "লাল রঙের ব্যাগ আছে?", "return kora jabe?", "ঠিক আছে, কনফার্ম করেন",
+    "apu ei bag ta nibo, dhaka te delivery koto din lagbe?", "অর্ডার ট্র্যাক করতে চাই",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+async def one_request(client: httpx.AsyncClient, url: str, session_id: str, text: str, stream: bool, results: dict):
+    started = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post(f"{url}/api/chat", data={"text": text, "session_id": session_id})
+            results["status"][response.status_code] += 1
+            if response.status_code == 200:
+                results["latency"].append(time.perf_counter() - started)
+            return
+        first_token = None
+        async with client.stream("POST", f"{url}/api/chat/stream", data={"text": text, "session_id": session_id}) as response:
+            results["status"][response.status_code] += 1
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: ") and event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+        if response.status_code == 200:
+            results["latency"].append(time.perf_counter() - started)
+            if first_token is not None:
+                results["ttft"].append(first_token)
+    except httpx.HTTPError as e:
+        results["status"][type(e).__name__] += 1
+
+
+async def worker(worker_id: int, args, client: httpx.AsyncClient, results: dict, deadline: float, counter: list):
+    # Each worker is one customer; a few turns per session exercise memory and caching
+    rng = random.Random(worker_id)
+    session_id = f"load-{worker_id}-0"
+    turn = 0
+    while time.perf_counter() < deadline:
+        if args.requests and counter[0] >= args.requests:
+            return
+        counter[0] += 1
+        if turn >= args.turns_per_session:
+            session_id = f"load-{worker_id}-{counter[0]}"
+            turn = 0
+        turn += 1
+        await one_request(client, args.url, session_id, rng.choice(MESSAGES), args.stream, results)
+
+
+async def run(args):
+    results = {"latency": [], "ttft": [], "status": Counter()}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    deadline = time.perf_counter() + (args.duration if args.duration else 10 ** 9)
+    counter = [0]
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, args, client, results, deadline, counter) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        ok = len(results["latency"])
+        print(f"{'stream' if args.stream else 'chat'}: {counter[0]} requests in {elapsed:.1f}s "
+              f"with concurrency {args.concurrency} -> {ok / elapsed:.1f} ok/s")
+        print(f"status: {dict(results['status'])}")
+        print(f"latency p50/p95/p99: {percentile(results['latency'], 50)} / "
+              f"{percentile(results['latency'], 95)} / {percentile(results['latency'], 99)} s")
+        if args.stream:
+            print(f"first token p50/p95: {percentile(results['ttft'], 50)} / {percentile(results['ttft'], 95)} s")
+
+        try:
+            router_stats = (await client.get(f"{args.url}/api/llm-router")).json()
+            print("llm router:", json.dumps(router_stats, indent=2, ensure_ascii=False))
+        except httpx.HTTPError as e:
+            print(f"Could not fetch router stats: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat endpoint load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="Total requests (0 = until --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds to run (0 = until --requests)")
+    parser.add_argument("--turns-per-session", type=int, default=4)
+    parser.add_argument("--stream", action="store_true", help="Use /api/chat/stream and measure time to first token")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error("set --requests or --duration")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from pathlib import Path
 from config.settings import settings
 from routes import chat_routes, product_routes, image_routes, login_routes
 from services.database_service import db_service
+from services.snapshot_watcher import snapshot_watcher
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -65,6 +66,17 @@ async def startup_event():
     else:
         print("FAIL: Database connection failed")
     
+    # Hot-reload vector stores whenever training publishes a new snapshot
+    await snapshot_watcher.start()
+    
+    # Keep-alive client for Graph API calls and attachment downloads
+    from services.http_client import http_client
+    await http_client.start()
+    
+    # Messenger events are processed in the background after the webhook acks them
+    from services.webhook_queue import webhook_queue
+    await webhook_queue.start()
+    
     print("OK: API startup complete (models will load on-demand)")
 
 
@@ -72,7 +84,24 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("Shutting down Smart RAG API...")
+    await snapshot_watcher.stop()
+    # Let queued webhook events reach the coalescing buffer, answer the bursts still
+    # waiting there, then finish those replies and stop the consumers
+    from services.webhook_queue import webhook_queue
+    from services.message_coalescer import message_coalescer
+    await webhook_queue.join()
+    await message_coalescer.drain()
+    await webhook_queue.stop()
+    from services.messenger_sender import messenger_sender
+    await messenger_sender.drain()
+    from services.http_client import http_client
+    await http_client.aclose()
+    from services.session_store import session_store
+    session_store.close()
+    from services.dedup_cache import webhook_dedup
+    webhook_dedup.close()
     from services.model_manager import model_manager
+    await model_manager.aclose_http_clients()
     model_manager.clear_models()
     print("OK: Cleanup complete")
 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible chat-completions server for load and latency testing.
+Replies with canned Bangla answers after a configurable, log-normally distributed
+time to first token, streams them at a configurable token rate and fails a
+configurable share of requests, so /api/chat and /webhook can be benchmarked
+without x.ai/Fireworks credits.
+
+    python mock_llm_server.py --port 9001 --ttft-median 0.6 --ttft-p95 2.5
+    python mock_llm_server.py --port 9002 --error-rate 0.3
+
+    LLM_BASE_URL=http://127.0.0.1:9001/v1 FALLBACK_LLM_BASE_URL=http://127.0.0.1:9002/v1 \\
+    LLM_API_KEY=mock FALLBACK_LLM_API_KEY=mock python start.py
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_REPLIES = [
+    (("দাম", "price", "pp", "কত", "koto"),
+     "প্রিয় গ্রাহক, পণ্যটির মূল্য ১২৫০ টাকা। আমাদের সব প্রডাক্ট সরাসরি ইমপোর্ট করা—কোয়ালিটিতে কোনো আপস নেই। অর্ডার করতে চাইলে জানাবেন।"),
+    (("ডেলিভারি", "delivery", "কবে", "kobe"),
+     "🚚 আমরা সারা বাংলাদেশে ক্যাশ অন হোম ডেলিভারি করে থাকি। ঢাকার ভিতরে ৮০ টাকা, ঢাকার বাইরে ১৫০ টাকা ডেলিভারি চার্জ।"),
+    (("অর্ডার", "order", "নিবো", "nibo"),
+     "📦 অর্ডার কনফার্ম করতে দয়া করে আপনার এলাকা এবং মোবাইল নাম্বার দিন। পণ্য হাতে পেয়ে চেক করে টাকা দিবেন।"),
+    (("সাইজ", "size"),
+     "আপনার Bata বা Apex জুতায় কোন নাম্বার লেখা আছে জানালে আমরা একদম পারফেক্ট সাইজের জুতা পাঠাবো।"),
+    (("কমানো", "komano", "discount", "ডিসকাউন্ট"),
+     "আমরা সবসময় সেরা মূল্যে পণ্য দিই, এর থেকে কমানো সম্ভব নয়। তবে গুণমান ও সেবায় আপনি নিশ্চিতভাবে সন্তুষ্ট হবেন!"),
+    (("সারাংশ",),
+     "গ্রাহক একটি ব্যাগের দাম ও ডেলিভারি চার্জ জানতে চেয়েছেন; এখনো অর্ডার কনফার্ম হয়নি।"),
+]
+DEFAULT_REPLY = "আসসালামু আলাইকুম! প্রিয় গ্রাহক, আপনাকে কীভাবে সাহায্য করতে পারি? পণ্যের ছবি দিলে দাম ও বিস্তারিত জানিয়ে দিচ্ছি।"
+
+
+class MockConfig:
+    def __init__(self, args):
+        self.ttft_median = args.ttft_median
+        self.ttft_p95 = max(args.ttft_p95, args.ttft_median)
+        self.tokens_per_second = args.tokens_per_second
+        self.error_rate = args.error_rate
+        self.error_status = args.error_status
+        self.hang_rate = args.hang_rate
+        self.random = random.Random(args.seed)
+
+    def time_to_first_token(self) -> float:
+        """Log-normal with the configured median and 95th percentile"""
+        if self.ttft_median <= 0:
+            return 0.0
+        sigma = math.log(self.ttft_p95 / self.ttft_median) / 1.645
+        return self.random.lognormvariate(math.log(self.ttft_median), sigma)
+
+
+def pick_reply(messages) -> str:
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    if isinstance(last_user, list):  # content parts
+        last_user = " ".join(part.get("text", "") for part in last_user if isinstance(part, dict))
+    # The app sends the whole prompt as one message; the question is at the end
+    question = last_user.rsplit("ব্যবহারকারী:", 1)[-1].lower()
+    for keywords, reply in CANNED_REPLIES:
+        if any(keyword in question for keyword in keywords):
+            return reply
+    return DEFAULT_REPLY
+
+
+def tokenize(text: str):
+    """Split into word-sized pieces, keeping the spaces, roughly like a BPE stream"""
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+
+def estimate_tokens(messages) -> int:
+    return sum(len(str(m.get("content", ""))) for m in messages) // 3 + 1
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+    stats = {"requests": 0, "streamed": 0, "errors": 0, "hangs": 0, "completed": 0}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        messages = body.get("messages", [])
+        model = body.get("model", "mock")
+        stream = bool(body.get("stream"))
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        ttft = config.time_to_first_token()
+        roll = config.random.random()
+        if roll < config.error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(min(ttft, 0.2))
+            return JSONResponse(status_code=config.error_status, content={
+                "error": {"message": "Mock upstream error", "type": "server_error", "code": config.error_status}
+            })
+        if roll < config.error_rate + config.hang_rate:
+            # A stalled upstream: never answers, for timeout and hedging tests
+            stats["hangs"] += 1
+            await asyncio.sleep(3600)
+
+        reply = pick_reply(messages)
+        pieces = tokenize(reply)
+        usage = {
+            "prompt_tokens": estimate_tokens(messages),
+            "completion_tokens": len(pieces),
+            "total_tokens": estimate_tokens(messages) + len(pieces),
+        }
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+        if not stream:
+            await asyncio.sleep(ttft + delay * len(pieces))
+            stats["completed"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events():
+            await asyncio.sleep(ttft)
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                yield chunk({"content": piece})
+                if delay:
+                    await asyncio.sleep(delay)
+            yield chunk({}, "stop")
+            if include_usage:
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                           "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+            stats["completed"] += 1
+
+        stats["streamed"] += 1
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default=env("MOCK_LLM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(env("MOCK_LLM_PORT", 9001)))
+    parser.add_argument("--ttft-median", type=float, default=float(env("MOCK_LLM_TTFT_MEDIAN", 0.5)),
+                        help="Median seconds before the first token")
+    parser.add_argument("--ttft-p95", type=float, default=float(env("MOCK_LLM_TTFT_P95", 1.5)),
+                        help="95th percentile seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=float(env("MOCK_LLM_TOKENS_PER_SECOND", 40)),
+                        help="Streaming rate after the first token (0 = all at once)")
+    parser.add_argument("--error-rate", type=float, default=float(env("MOCK_LLM_ERROR_RATE", 0.0)),
+                        help="Share of requests answered with an error status")
+    parser.add_argument("--error-status", type=int, default=int(env("MOCK_LLM_ERROR_STATUS", 500)),
+                        help="Status code for failed requests, e.g. 500 or 429")
+    parser.add_argument("--hang-rate", type=float, default=float(env("MOCK_LLM_HANG_RATE", 0.0)),
+                        help="Share of requests that never answer")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"Mock LLM on http://{args.host}:{args.port}/v1 (TTFT median {args.ttft_median}s, p95 {args.ttft_p95}s, "
+          f"{args.tokens_per_second} tok/s, errors {args.error_rate:.0%}, hangs {args.hang_rate:.0%})")
+    uvicorn.run(create_app(MockConfig(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import asyncio
+import io
+import time
+from collections import Counter, deque
+from typing import List, Optional
+
+import httpx
+from PIL import Image
+
+from config.settings import settings
+from services.http_client import http_client
+from services.metrics import percentile
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class AttachmentDownloader:
+    """
+    Downloads the image attachments of a Messenger message concurrently through the
+    shared HTTP client. Each body is streamed and aborted once it passes `max_bytes`,
+    each download has its own `timeout` (a slow one is cancelled without affecting
+    the others), and images are decoded straight to at most `max_side` pixels (JPEG
+    draft mode decodes at reduced scale instead of decoding full size and shrinking).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = settings.ATTACHMENT_MAX_BYTES,
+        timeout: float = settings.ATTACHMENT_TIMEOUT,
+        max_side: int = settings.ATTACHMENT_IMAGE_MAX_SIDE,
+        window: int = 1000,
+    ):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_side = max_side
+        self.latencies = deque(maxlen=window)
+        self.stats = Counter()
+
+    async def fetch_images(self, urls: List[str]) -> List[Image.Image]:
+        """Decoded images for the urls that could be fetched, in the original order"""
+        results = await asyncio.gather(*(self._fetch_image(url) for url in urls))
+        return [image for image in results if image is not None]
+
+    async def _fetch_image(self, url: str) -> Optional[Image.Image]:
+        started = time.monotonic()
+        try:
+            data = await asyncio.wait_for(self._download(url), self.timeout)
+            image = await asyncio.to_thread(self.decode, data)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            print(f" Image download timed out after {self.timeout}s")
+            return None
+        except AttachmentTooLarge as e:
+            self.stats["too_large"] += 1
+            print(f" Image skipped: {e}")
+            return None
+        except (httpx.HTTPError, OSError) as e:
+            # OSError covers files PIL cannot identify or decode
+            self.stats["failed"] += 1
+            print(f" Failed to download image: {e}")
+            return None
+        except (Image.DecompressionBombError, ValueError) as e:
+            # Oversized pixel counts and malformed image data; skip this image, keep the others
+            self.stats["undecodable"] += 1
+            print(f" Image skipped, cannot decode it: {e}")
+            return None
+        self.stats["downloaded"] += 1
+        self.stats["bytes"] += len(data)
+        self.latencies.append(time.monotonic() - started)
+        return image
+
+    async def _download(self, url: str) -> bytes:
+        async with http_client.get().stream("GET", url) as response:
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(f"status {response.status_code}", request=response.request, response=response)
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise AttachmentTooLarge(f"{length} bytes > {self.max_bytes}")
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data.extend(chunk)
+                if len(data) > self.max_bytes:
+                    raise AttachmentTooLarge(f"more than {self.max_bytes} bytes")
+        return bytes(data)
+
+    def decode(self, data: bytes) -> Image.Image:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (self.max_side, self.max_side))
+        image = image.convert("RGB")
+        image.thumbnail((self.max_side, self.max_side))
+        return image
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "max_bytes": self.max_bytes,
+            "latency_p50_s": percentile(self.latencies, 50),
+            "latency_p95_s": percentile(self.latencies, 95),
+        }
+
+
+# Global attachment downloader instance
+attachment_downloader = AttachmentDownloader()
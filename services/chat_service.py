@@ -0,0 +1,325 @@
+import asyncio
+import io
+import re
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, List, Optional, Tuple, Union
+from uuid import uuid4
+
+import gspread
+import numpy as np
+from google.oauth2.service_account import Credentials
+from PIL import Image
+
+from config.settings import settings
+from services.database_service import db_service
+from services.fast_responder import IMAGE_ONLY_QUERY, fast_responder
+from services.intent_detector import intent_detector
+from services.model_manager import model_manager
+from services.prompt_builder import build_prompt, prompt_stats
+from services.response_cache import response_cache
+from services.session_locks import session_locks
+from services.session_store import Session, session_store
+
+# Images are passed already decoded, as raw bytes or as an open binary file; none is re-encoded
+ImageSource = Union[Image.Image, bytes, BinaryIO]
+
+
+def validate_offer_price(response: str, products: List[dict]) -> str:
+    """
+    Validate the offered price in the bot's response to ensure it is not below the marginal price.
+    If below, adjust to the marginal price of the most relevant product.
+    """
+    if not products:
+        return response
+    
+    # Assume the first product is the most relevant
+    marginal_price = float(products[0]["marginal_price"])
+    print(f"Marginal price of the most relevant product: {marginal_price}")
+    
+    # Extract the offered price from the response (assuming format like "[number] টাকা")
+    match = re.search(r'(\d+\.?\d*)\s*টাকা', response)
+    if match:
+        offered_price = float(match.group(1))
+        if offered_price < marginal_price:
+            # Replace the offered price with the marginal price
+            response = re.sub(r'\d+\.?\d*\s*টাকা', f"{int(marginal_price)} টাকা", response)
+    
+    return response
+
+def add_to_google_sheet(phone_number: str):
+    try:
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        creds = Credentials.from_service_account_file("google_sheet.json", scopes=scope)
+        client = gspread.authorize(creds)
+        sheet = client.open_by_key("1eEuya073QSg0iXsued7e1xJbcrRdKuD7UH7JsyQLvS0").sheet1
+        
+        today_date = datetime.now().strftime("%Y-%m-%d")
+        sheet.insert_row([phone_number, today_date], index=2) # index=2 to insert at the top after header
+        print(f"Successfully added {phone_number} to Google Sheet.")
+    except Exception as e:
+        print(f"Error adding to Google Sheet: {e}")
+
+FALLBACK_REPLY = "দুঃখিত, এই মুহূর্তে আমি আপনার অনুরোধটি প্রক্রিয়া করতে পারছি না। অনুগ্রহ করে কিছুক্ষণ পর আবার চেষ্টা করুন।"
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Open raw image bytes or a binary file object (e.g. an upload's spooled file) without copying it"""
+    if isinstance(source, Image.Image):
+        return source
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def search_images(images: List[ImageSource], image_index, image_metadata: List[dict]) -> List[dict]:
+    """Nearest catalogue product for each image (YOLO + CLIP + FAISS; blocking, run it in a thread)"""
+    products = []
+    for image_source in images:
+        image = open_image(image_source)
+        image_embedding = model_manager.get_image_embedding(image)
+        D, I = image_index.search(np.array([image_embedding]).astype('float32'), k=1)
+        products.extend(model_manager.expand_image_match(image_metadata[I[0][0]]))
+    return products
+
+
+def turn_replay(session: Session, user_query: Optional[str] = None, bot_response: Optional[str] = None,
+                product_ids: Iterable = ()) -> Callable[[Session], None]:
+    """This turn's changes to `session`, for replaying onto a copy another worker saved meanwhile"""
+    def replay(latest: Session):
+        latest.message_count += 1
+        latest.product_ids = session.product_ids
+        if bot_response is not None:
+            latest.memory.save_turn(user_query, bot_response, product_ids)
+    return replay
+
+
+async def prepare_chat_turn(images: Optional[List[ImageSource]], text: Optional[str], session_id: Optional[str]) -> dict:
+    """
+    First half of a chat turn, shared by every entry point: session lookup, image
+    retrieval, the greeting shortcut and the LLM inputs.
+    If the turn is already answered (or failed) the returned dict has "early" set to the
+    response payload and "status_code" to its HTTP status.
+    """
+    session_id = session_id or str(uuid4())
+    session = await session_store.load(session_id)
+    memory = session.memory
+    retrieved_products = session.get_products()
+    session.message_count += 1  # Increment message count
+    turn = {"session_id": session_id, "session": session, "early": None, "status_code": 200}
+
+    # Define query early to allow conditional logic
+    user_query = text.strip() if text else IMAGE_ONLY_QUERY
+
+    # Image search - Process images FIRST, before checking for greetings
+    if images:
+        image_index = model_manager.get_image_index()
+        image_metadata = model_manager.get_image_metadata()
+        
+        if image_index is None or not image_metadata:
+            turn.update(early={"error": "Image search not available"}, status_code=500)
+            return turn
+
+        # Model inference would otherwise stall every webhook ack and stream on this worker
+        retrieved_products = await asyncio.to_thread(search_images, images, image_index, image_metadata)
+        session.set_products(retrieved_products)
+
+    print("retrieved_products:", retrieved_products)
+
+    # Handle greeting/price query for first-time users with no product context
+    # CHECK THIS AFTER image processing but BEFORE text search
+    bot_response = fast_responder.greeting_reply(user_query, retrieved_products)
+    if bot_response is not None:
+        await session_store.save(session_id, session, turn_replay(session))
+        turn["early"] = {
+            "reply": bot_response,
+            "related_products": [],
+            "session_id": session_id
+        }
+        return turn
+
+    # Text search - now this block runs ONLY if the greeting condition was NOT met, and if 'text' is provided
+    if text:
+        # text_vector_store = model_manager.get_text_vector_store()
+        # if text_vector_store is None:
+        #     return JSONResponse(status_code=500, content={"error": "Text search not available"})
+            
+        # docs = text_vector_store.similarity_search(text, k=1)
+        # for doc in docs:
+        #     retrieved_products.append(doc.metadata)
+        session.set_products(retrieved_products)
+
+    # Remove duplicates
+    seen_products = set()
+    unique_products = []
+    for product in retrieved_products:
+        identifier = (product.get('name', '').strip(), product.get('code', '').strip())
+        if identifier not in seen_products:
+            seen_products.add(identifier)
+            unique_products.append(product)
+    retrieved_products = unique_products
+
+    # Build context
+    context = "\nAvailable products:\n"
+    for product in retrieved_products:
+        context += f"- Name: {product['name']}, Price: {product['price']},Description: {product['description']} Link: {product['link']}\n"
+    print("Context for LLM:", context)
+
+    # Check for phone number and save to Google Sheet
+    phone_pattern = r'(?:\d{8,11}|[০-৯]{8,11})'
+    match = re.search(phone_pattern, user_query)
+    if match:
+        phone_number = match.group(0)
+        await asyncio.to_thread(add_to_google_sheet, phone_number)
+
+    chat_history = memory.render()
+    inputs = {"chat_history": chat_history, "user_query": user_query, "context": context}
+    print(inputs)
+    # Cached replies are only reused when the conversation so far cannot change the answer
+    cacheable = settings.RESPONSE_CACHE_ENABLED and not chat_history and not match
+
+    intents = intent_detector.detect_intents(user_query, has_images=bool(images))
+    turn.update(user_query=user_query, products=retrieved_products, inputs=inputs, cacheable=cacheable)
+
+    # Replies fully determined by data skip the LLM altogether
+    turn["fast_reply"] = fast_responder.respond(
+        user_query, intents, retrieved_products,
+        has_images=bool(images), first_message=not chat_history, has_phone=bool(match),
+    )
+    if turn["fast_reply"] is not None:
+        print(f"Fast reply for intent: {turn['fast_reply'][1]}")
+        return turn
+
+    # Send only the prompt sections the detected intents need
+    assembled = build_prompt(intent for intent, _ in intents)
+    usage = prompt_stats.record(assembled, inputs)
+    print(f"Intents: {[intent.value for intent, _ in intents]}, prompt sections: {list(assembled.sections)}, "
+          f"~{usage['prompt_tokens']} prompt tokens ({usage['saved_tokens']} saved)")
+    turn["prompt"] = assembled
+    return turn
+
+
+async def lookup_cached_reply(turn: dict) -> Optional[dict]:
+    """Consult the response cache for a cacheable turn; returns the lookup result or None"""
+    if not turn["cacheable"]:
+        return None
+    product_ids = [product.get("id") for product in turn["products"]]
+    lookup = await response_cache.lookup(
+        turn["user_query"], product_ids, turn["prompt"].version, turn["inputs"]["context"]
+    )
+    if lookup["reply"] is not None:
+        print(f"Response cache hit ({lookup['tier']})")
+    return lookup
+
+
+def increment_message_count():
+    try:
+        with db_service.get_cursor() as (cursor, connection):
+            cursor.execute("UPDATE business_settings SET value = value + 1 WHERE `key` = 'number_of_message'")
+            connection.commit()
+    except Exception as e:
+        print(f"Error incrementing message count: {e}")
+
+
+async def finish_chat_turn(turn: dict, bot_response: str):
+    """Second half of a chat turn: message counter, memory and saving the session"""
+    # Increment message count in database (blocking MySQL call, so in a thread)
+    await asyncio.to_thread(increment_message_count)
+
+    # Save to memory; it stays within its token budget by summarizing older turns
+    session = turn["session"]
+    product_ids = [product.get("id") for product in turn["products"]]
+    session.memory.save_turn(turn["user_query"], bot_response, product_ids)
+    await session_store.save(
+        turn["session_id"], session, turn_replay(session, turn["user_query"], bot_response, product_ids)
+    )
+
+
+def public_products(products: List[dict]) -> List[dict]:
+    """Strip internal pricing before products are sent to the client"""
+    return [{k: v for k, v in product.items() if k != "marginal_price"} for product in products]
+
+async def run_chat_turn(text: Optional[str], images: Optional[List[ImageSource]] = None,
+                        session_id: Optional[str] = None) -> Tuple[int, dict]:
+    """
+    One complete, non-streaming chat turn, used by /api/chat and the Messenger webhook.
+    Turns of one conversation run one at a time. Returns (status_code, payload).
+    """
+    session_id = session_id or str(uuid4())
+    async with session_locks.hold(session_id):
+        turn = await prepare_chat_turn(images, text, session_id)
+        if turn["early"] is not None:
+            return turn["status_code"], turn["early"]
+        inputs = turn["inputs"]
+
+        cache_lookup = None if turn["fast_reply"] is not None else await lookup_cached_reply(turn)
+        if turn["fast_reply"] is not None:
+            bot_response = turn["fast_reply"][0]
+        elif cache_lookup and cache_lookup["reply"] is not None:
+            bot_response = cache_lookup["reply"]
+        else:
+            try:
+                bot_response, provider = await model_manager.get_llm_router().ainvoke(
+                    turn["prompt"].template, inputs, label=turn["prompt"].version
+                )
+                if cache_lookup:
+                    response_cache.store(cache_lookup, bot_response)
+            except Exception as e:
+                print(f"All LLM providers failed: {e}")
+                bot_response = FALLBACK_REPLY
+
+        print("Raw bot response:", bot_response)
+
+        await finish_chat_turn(turn, bot_response)
+
+        return 200, {
+            "reply": bot_response,
+            "related_products": public_products(turn["products"]),
+            "session_id": session_id
+        }
+
+
+async def stream_chat_turn(turn: dict) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Answer a prepared chat turn as (event, data) pairs for /api/chat/stream:
+    "products", one "token" per model chunk, "final" (after price validation) and "done"
+    """
+    session_id = turn["session_id"]
+    if turn["early"] is not None:
+        yield "products", {"related_products": [], "session_id": session_id}
+        yield "final", turn["early"]
+        yield "done", {}
+        return
+
+    yield "products", {
+        "related_products": public_products(turn["products"]),
+        "session_id": session_id
+    }
+
+    parts = []
+    completed = False
+    cache_lookup = None if turn["fast_reply"] is not None else await lookup_cached_reply(turn)
+    if turn["fast_reply"] is not None:
+        parts.append(turn["fast_reply"][0])
+        yield "token", {"text": turn["fast_reply"][0]}
+    elif cache_lookup and cache_lookup["reply"] is not None:
+        parts.append(cache_lookup["reply"])
+        yield "token", {"text": cache_lookup["reply"]}
+    else:
+        try:
+            async for provider, text in model_manager.get_llm_router().astream(
+                turn["prompt"].template, turn["inputs"], label=turn["prompt"].version
+            ):
+                parts.append(text)
+                yield "token", {"text": text}
+            completed = True
+        except Exception as e:
+            # If tokens already reached the client, keep what we have
+            print(f"LLM stream failed: {e}")
+
+    bot_response = "".join(parts) or FALLBACK_REPLY
+    bot_response = validate_offer_price(bot_response, turn["products"])
+    if completed and cache_lookup:
+        response_cache.store(cache_lookup, bot_response)
+    print("Raw bot response:", bot_response)
+    await finish_chat_turn(turn, bot_response)
+
+    yield "final", {"reply": bot_response, "session_id": session_id}
+    yield "done", {}
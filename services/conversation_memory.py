@@ -0,0 +1,157 @@
+import asyncio
+from typing import Iterable, List, Tuple
+
+from langchain.prompts import PromptTemplate
+
+from config.settings import settings
+from services.prompt_builder import count_tokens
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "turns", "max_words"],
+    template=(
+        "নিচে একজন গ্রাহক ও momsandkidsworld এর বিক্রয় সহকারীর কথোপকথনের আগের সারাংশ এবং নতুন অংশ দেওয়া হলো। "
+        "দুটো মিলিয়ে বাংলায় একটি সংক্ষিপ্ত সারাংশ লিখুন, সর্বোচ্চ {max_words} শব্দে। "
+        "গ্রাহক কী চেয়েছেন, কোন পণ্য আইডি নিয়ে কথা হয়েছে, সাইজ, এলাকা, মোবাইল নাম্বার ও অর্ডারের অবস্থা রাখুন; "
+        "শুভেচ্ছা ও পুনরাবৃত্তি বাদ দিন। শুধু সারাংশটি লিখুন।\n\n"
+        "আগের সারাংশ:\n{summary}\n\n"
+        "নতুন অংশ:\n{turns}\n\n"
+        "সারাংশ:"
+    )
+)
+
+# Summaries run as background tasks; keep references so they are not garbage collected
+_background_tasks = set()
+
+Turn = Tuple[str, str, Tuple]  # (user message, bot reply, product ids)
+
+
+def product_note(product_ids: Tuple) -> str:
+    return f" [পণ্য আইডি: {', '.join(str(pid) for pid in product_ids)}]" if product_ids else ""
+
+
+def render_turn(turn: Turn) -> str:
+    user, bot, product_ids = turn
+    return f"ব্যবহারকারী: {user}{product_note(product_ids)}\nবট: {bot}"
+
+
+class TokenBudgetMemory:
+    """
+    Conversation memory with a token budget, replacing ConversationBufferMemory.
+    The last `recent_turns` turns are kept verbatim; older turns, and recent ones that
+    would push the history over `max_tokens`, are folded into a rolling summary by the
+    LLM in a background task, so summarizing never delays a reply. Until the summary
+    lands, folded turns are shown by their user message only. Products are kept as ids.
+    """
+
+    __slots__ = ("max_tokens", "recent_turns", "summary_max_tokens", "summary", "turns", "pending",
+                 "summarized_turns", "_summarizing", "on_summary")
+    RUNTIME_FIELDS = ("_summarizing", "on_summary")
+
+    def __init__(
+        self,
+        max_tokens: int = settings.MEMORY_MAX_TOKENS,
+        recent_turns: int = settings.MEMORY_RECENT_TURNS,
+        summary_max_tokens: int = settings.MEMORY_SUMMARY_MAX_TOKENS,
+    ):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.summary = ""
+        self.turns: List[Turn] = []
+        self.pending: List[Turn] = []  # folded out of `turns`, not yet in the summary
+        self.summarized_turns = 0
+        self._summarizing = False
+        self.on_summary = None  # called after a background summary changed the memory
+
+    def __getstate__(self) -> dict:
+        # Shared session backends pickle the memory; runtime fields stay behind
+        return {name: getattr(self, name) for name in self.__slots__ if name not in self.RUNTIME_FIELDS}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._summarizing = False
+        self.on_summary = None
+
+    def __bool__(self) -> bool:
+        return bool(self.summary or self.turns or self.pending)
+
+    def _tokens(self, turns: Iterable[Turn]) -> int:
+        return sum(count_tokens(render_turn(turn)) for turn in turns)
+
+    def save_turn(self, user_query: str, bot_response: str, product_ids: Iterable = ()):
+        self.turns.append((user_query, bot_response, tuple(pid for pid in product_ids if pid is not None)))
+
+        budget = self.max_tokens - count_tokens(self.summary)
+        while len(self.turns) > 1 and (len(self.turns) > self.recent_turns or self._tokens(self.turns) > budget):
+            self.pending.append(self.turns.pop(0))
+        if self.pending:
+            self._schedule_summary()
+
+    def render(self) -> str:
+        """Chat history text for the prompt; empty for a new conversation"""
+        parts = []
+        if self.summary:
+            parts.append(f"আগের কথোপকথনের সারাংশ: {self.summary}")
+        for user, _, product_ids in self.pending:
+            parts.append(render_turn((user, "…", product_ids)))
+        parts.extend(render_turn(turn) for turn in self.turns)
+        return "\n".join(parts)
+
+    def _schedule_summary(self):
+        if self._summarizing:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._fold_without_llm(len(self.pending))
+            return
+        self._summarizing = True
+        task = loop.create_task(self._summarize())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    def _fold_without_llm(self, count: int):
+        """Extractive fallback: append the folded user messages to the summary"""
+        batch = self.pending[:count]
+        notes = "; ".join(user[:80] + product_note(ids) for user, _, ids in batch)
+        self._apply_summary(f"{self.summary} {notes}".strip(), count)
+
+    def _apply_summary(self, summary: str, count: int):
+        # Keep the summary itself within its budget, dropping the oldest part first
+        while count_tokens(summary) > self.summary_max_tokens and " " in summary:
+            summary = summary.split(" ", 1)[1]
+        self.summary = summary
+        self.pending = self.pending[count:]
+        self.summarized_turns += count
+
+    async def _summarize(self):
+        from services.model_manager import model_manager
+
+        try:
+            while self.pending:
+                count = len(self.pending)
+                batch = "\n".join(render_turn(turn) for turn in self.pending[:count])
+                try:
+                    summary, _ = await model_manager.get_llm_router().ainvoke(SUMMARY_PROMPT, {
+                        "summary": self.summary or "(নেই)",
+                        "turns": batch,
+                        # Bangla words run about 3 tokens each
+                        "max_words": max(20, self.summary_max_tokens // 3),
+                    }, label="summary")
+                    self._apply_summary(summary.strip(), count)
+                except Exception as e:
+                    print(f"Conversation summary failed, keeping an extractive one: {e}")
+                    self._fold_without_llm(count)
+        finally:
+            self._summarizing = False
+            if self.on_summary is not None:
+                self.on_summary()
+
+    def get_stats(self) -> dict:
+        return {
+            "turns": len(self.turns),
+            "pending": len(self.pending),
+            "summarized_turns": self.summarized_turns,
+            "history_tokens": count_tokens(self.render()),
+        }
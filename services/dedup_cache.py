@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from config.settings import settings
+
+
+class DedupCache:
+    """
+    Bounded TTL set of recently seen webhook message ids (`mid`), so Facebook
+    redeliveries are answered only once.
+    Ids are kept in first-seen order, which is also expiry order: inserts, lookups and
+    expiry are O(1), and beyond `max_entries` the oldest id is evicted. With
+    `sqlite_path` set, ids are also recorded in a SQLite table shared by every worker
+    on the host, so a redelivery landing on another worker is caught too.
+    """
+
+    CLEANUP_EVERY = 500
+
+    def __init__(
+        self,
+        max_entries: int = settings.WEBHOOK_DEDUP_MAX_ENTRIES,
+        ttl: float = settings.WEBHOOK_DEDUP_TTL,
+        sqlite_path: Optional[str] = settings.WEBHOOK_DEDUP_SQLITE_PATH,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path or None
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self.stats = Counter()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+    def _shared(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.sqlite_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.sqlite_path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen_messages (mid TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS seen_messages_at ON seen_messages (seen_at)")
+        return self._conn
+
+    def _expire(self, now: float):
+        while self._seen:
+            mid, seen_at = next(iter(self._seen.items()))
+            if now - seen_at > self.ttl:
+                self.stats["expired"] += 1
+            elif len(self._seen) > self.max_entries:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._seen[mid]
+
+    async def check_and_add(self, mid: str) -> bool:
+        """True if `mid` was already seen within the TTL; otherwise records it and returns False"""
+        now = time.time()
+        self._expire(now)
+        if mid in self._seen:
+            self.stats["hits"] += 1
+            return True
+
+        # Recorded before the shared check, so a redelivery arriving meanwhile is a local hit
+        self._seen[mid] = now
+        self._expire(now)
+        if self.sqlite_path and await asyncio.to_thread(self._seen_by_other_worker, mid, now):
+            self.stats["shared_hits"] += 1
+            return True
+
+        self.stats["misses"] += 1
+        return False
+
+    def _seen_by_other_worker(self, mid: str, now: float) -> bool:
+        try:
+            with self._lock:
+                conn = self._shared()
+                # Inserts the id, or takes over an expired row; no change means it is a live duplicate
+                changed = conn.execute(
+                    "INSERT INTO seen_messages (mid, seen_at) VALUES (?, ?) "
+                    "ON CONFLICT(mid) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_messages.seen_at < ?",
+                    (mid, now, now - self.ttl),
+                ).rowcount
+                self._inserts += 1
+                if self._inserts % self.CLEANUP_EVERY == 0:
+                    conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.ttl,))
+            return not changed
+        except sqlite3.Error as e:
+            # The per-worker cache still works without the shared table
+            self.stats["shared_errors"] += 1
+            print(f"Shared dedup table unavailable: {e}")
+            return False
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "size": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "shared": bool(self.sqlite_path),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global dedup cache for webhook message ids
+webhook_dedup = DedupCache()
@@ -0,0 +1,214 @@
+import re
+import time
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from services.intent_detector import IntentType
+from services.prompt_builder import (
+    CANCEL_ORDER_REPLY,
+    COMPLAINT_REPLY,
+    DELIVERY_REPLY,
+    IMAGE_REQUEST_REPLY,
+    ORDER_INFO_REPLY,
+    ORDER_SIZE_QUESTION,
+    RETURN_POLICY_REPLY,
+    SIZE_CHART_REPLY,
+    TRACK_ORDER_REPLY,
+)
+
+GREETING_REPLY = "আসসালামু আলাইকুম...\n\nআপনি যে প্রোডাক্ট টি সম্পর্কে জানতে চাচ্ছেন, দয়া করে ছবি দিন।"
+GREETING_KEYWORDS = ["pp", "price", "assalamu alaiikum", "salam", "আসসালামু আলাইকুম", "প্রাইজ", "প্রাইস কত", "দাম", "মূল্য", "hi", "hello", "hey", "হাই", "হ্যালো", "হেলো", ".", "😊", "😂", "❤️", "👍", "🙏", "🤩", "😁", "😞", "🔥", "✨", "🎉"]
+SALAM = "আসসালামু আলাইকুম! "
+# One substring search instead of a Python-level loop over every keyword
+GREETING_REGEX = re.compile("|".join(re.escape(k) for k in sorted(GREETING_KEYWORDS, key=len, reverse=True)))
+
+# Replies that do not depend on the product or the conversation
+STATIC_REPLIES = {
+    IntentType.DELIVERY_INQUIRY: DELIVERY_REPLY,
+    IntentType.RETURN_POLICY: RETURN_POLICY_REPLY,
+    IntentType.SIZE_CHART: SIZE_CHART_REPLY,
+    IntentType.TRACK_ORDER: TRACK_ORDER_REPLY,
+    IntentType.IMAGE_REQUEST: IMAGE_REQUEST_REPLY,
+    IntentType.COMPLAINT: COMPLAINT_REPLY,
+    IntentType.CANCEL_ORDER: CANCEL_ORDER_REPLY,
+}
+
+# Query used for messages that carry only images: the customer wants name and price
+IMAGE_ONLY_QUERY = "আপলোড করা পণ্যগুলোর নাম এবং মূল্য প্রদান করুন।"
+
+# Short messages that are unambiguous on their own, answered even below FAST_RESPONDER_MIN_SCORE
+# (compared after normalize_message)
+CONFIDENT_PHRASES = {
+    IntentType.PRICE_INQUIRY: [
+        "pp", "price", "price koto", "price please", "dam koto", "koto taka", "how much",
+        "দাম", "দাম কত", "দাম কতো", "প্রাইস কত", "মূল্য কত", "কত টাকা", IMAGE_ONLY_QUERY,
+    ],
+    IntentType.DELIVERY_INQUIRY: ["delivery charge", "ডেলিভারি চার্জ"],
+    IntentType.RETURN_POLICY: ["return policy", "exchange policy", "রিটার্ন পলিসি"],
+    IntentType.SIZE_CHART: ["size chart", "সাইজ চার্ট"],
+    IntentType.TRACK_ORDER: ["track order", "order track", "order status", "অর্ডার ট্র্যাক"],
+    IntentType.IMAGE_REQUEST: ["more picture", "real picture", "ছবি দিন", "ছবি দেখান", "আরো ছবি দিন"],
+    IntentType.CANCEL_ORDER: ["cancel order", "order cancel", "অর্ডার ক্যান্সেল", "অর্ডার বাতিল"],
+    IntentType.ORDER_INQUIRY: ["order", "order korbo", "অর্ডার", "অর্ডার করবো", "অর্ডার করতে চাই"],
+}
+_NON_WORD = re.compile(r'[^\w\u0980-\u09FF]+')
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, punctuation and emoji dropped, whitespace collapsed"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+_PHRASE_INTENTS = {
+    normalize_message(phrase): intent for intent, phrases in CONFIDENT_PHRASES.items() for phrase in phrases
+}
+
+# A single incidental product keyword ("size", "জুতা") does not make a question open-ended
+INCIDENTAL_PRODUCT_SCORE = 0.3
+
+_SIZE_INFO = re.compile(r'(সাইজ|size)\s*[=:]', re.IGNORECASE)
+# The product_details prompt section always shows the description of these products
+_DESCRIBED_PRODUCT = re.compile(r'সাইজ|size|জুতা|shoe', re.IGNORECASE)
+_BANGLA_DIGITS = str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯")
+
+
+def format_price(price) -> str:
+    try:
+        value = float(price)
+    except (TypeError, ValueError):
+        return str(price)
+    return f"{value:.0f}" if value.is_integer() else f"{value:.2f}"
+
+
+def has_size_info(product: dict) -> bool:
+    return bool(_SIZE_INFO.search(product.get("description") or ""))
+
+
+def needs_description(product: dict) -> bool:
+    """Shoes and products with size details are quoted with their description, not the bare price"""
+    return bool(_DESCRIBED_PRODUCT.search(f"{product.get('name') or ''} {product.get('description') or ''}"))
+
+
+class FastResponder:
+    """
+    Answers messages whose reply is fully determined by data, without calling the LLM:
+    the greeting for image-less first messages, the price of the retrieved products
+    (unless one needs its description, see `needs_description`),
+    delivery charges, return policy, size chart, order template and the fixed replies
+    for tracking, image requests, complaints and cancellations.
+    Only sure intents are answered: an exact phrase from CONFIDENT_PHRASES, or a single
+    question whose patterns score at least `min_score`. One keyword hit ("lagbe na",
+    "taka", "change") is not enough; such messages and any with more than one real
+    question fall through to the LLM.
+    """
+
+    def __init__(self, enabled: bool = settings.FAST_RESPONDER_ENABLED,
+                 min_score: float = settings.FAST_RESPONDER_MIN_SCORE):
+        self.enabled = enabled
+        self.min_score = min_score
+        self.answered = Counter()
+        self.fell_through = 0
+        self.total_time_s = 0.0
+
+    def _record(self, intent: Optional[str], started: float):
+        self.total_time_s += time.perf_counter() - started
+        if intent is None:
+            self.fell_through += 1
+        else:
+            self.answered[intent] += 1
+
+    def greeting_reply(self, user_query: str, products: List[dict]) -> Optional[str]:
+        """Greeting/price query from a user who has not sent a product image yet"""
+        started = time.perf_counter()
+        if not products and GREETING_REGEX.search(user_query.lower()):
+            self._record("greeting", started)
+            return GREETING_REPLY
+        return None
+
+    def _single_intent(
+        self, intents: Iterable[Tuple[IntentType, float]], products: List[dict], has_images: bool
+    ) -> Optional[Tuple[IntentType, float]]:
+        remaining = {}
+        for intent, score in intents:
+            if intent == IntentType.GREETING:
+                continue
+            if intent == IntentType.PRODUCT_SEARCH and (has_images or score <= INCIDENTAL_PRODUCT_SCORE):
+                continue
+            remaining[intent] = score
+        # "ডেলিভারি চার্জ কত" asks for the charges; with a product at hand it may ask for the total instead
+        if not products and set(remaining) == {IntentType.DELIVERY_INQUIRY, IntentType.PRICE_INQUIRY}:
+            return IntentType.DELIVERY_INQUIRY, remaining[IntentType.DELIVERY_INQUIRY]
+        return next(iter(remaining.items())) if len(remaining) == 1 else None
+
+    def _sure_intent(
+        self, message: str, intents: List[Tuple[IntentType, float]], products: List[dict], has_images: bool
+    ) -> Optional[IntentType]:
+        intent = _PHRASE_INTENTS.get(normalize_message(message))
+        if intent is not None:
+            return intent
+        single = self._single_intent(intents, products, has_images)
+        if single is None or single[1] < self.min_score:
+            return None
+        return single[0]
+
+    def _price_reply(self, products: List[dict]) -> str:
+        if len(products) == 1:
+            product = products[0]
+            return f"{product['name']}\nমূল্য: {format_price(product['price'])} টাকা"
+        return "\n".join(
+            f"{str(i).translate(_BANGLA_DIGITS)}. {product['name']} - {format_price(product['price'])} টাকা"
+            for i, product in enumerate(products, start=1)
+        )
+
+    def respond(
+        self,
+        message: str,
+        intents: List[Tuple[IntentType, float]],
+        products: List[dict],
+        has_images: bool = False,
+        first_message: bool = False,
+        has_phone: bool = False,
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Returns (reply, intent name) when the message can be answered without the LLM,
+        otherwise None.
+        """
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        reply = None
+        # A phone number means the customer is placing the order; the LLM handles that
+        intent = None if has_phone else self._sure_intent(message, intents, products, has_images)
+
+        if intent in STATIC_REPLIES:
+            reply = STATIC_REPLIES[intent]
+        elif intent == IntentType.PRICE_INQUIRY and products and not any(needs_description(p) for p in products):
+            reply = self._price_reply(products)
+        elif intent == IntentType.ORDER_INQUIRY and products and first_message:
+            # Later in a conversation the size or address may already be known
+            reply = ORDER_SIZE_QUESTION if any(has_size_info(p) for p in products) else ORDER_INFO_REPLY
+
+        if reply is None:
+            self._record(None, started)
+            return None
+        if first_message:
+            reply = SALAM + reply
+        self._record(intent.value, started)
+        return reply, intent.value
+
+    def get_stats(self) -> dict:
+        answered = sum(self.answered.values())
+        total = answered + self.fell_through
+        return {
+            "enabled": self.enabled,
+            "llm_calls_avoided": answered,
+            "fell_through_to_llm": self.fell_through,
+            "avoided_rate": round(answered / total, 4) if total else None,
+            "avg_decision_us": round(self.total_time_s / total * 1e6, 1) if total else None,
+            "by_intent": dict(self.answered),
+        }
+
+
+# Global fast responder instance
+fast_responder = FastResponder()
@@ -0,0 +1,41 @@
+from typing import Optional
+
+import httpx
+
+from config.settings import settings
+
+
+class SharedHttpClient:
+    """
+    One application-lifetime httpx.AsyncClient for outbound calls other than the LLMs:
+    the Graph API (sending replies, sender actions) and attachment downloads from the
+    Facebook CDN. Connections are kept alive and reused across messages.
+    Opened on startup and closed on shutdown; `get` also opens it lazily.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def get(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+            )
+            timeout = httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+            self._client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+        return self._client
+
+    async def start(self):
+        self.get()
+        print("OK: Shared HTTP client ready")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global shared HTTP client instance
+http_client = SharedHttpClient()
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import time
+from typing import Optional, Tuple
+
+from config.settings import settings
+
+
+def create_snapshot_dir() -> str:
+    """Create a fresh, unpublished snapshot directory for a training run"""
+    name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+    snapshot_dir = os.path.join(settings.SNAPSHOTS_PATH, name)
+    os.makedirs(os.path.join(snapshot_dir, "image_faiss"), exist_ok=True)
+    os.makedirs(os.path.join(snapshot_dir, "text_faiss"), exist_ok=True)
+    return snapshot_dir
+
+
+def publish_snapshot(snapshot_dir: str) -> dict:
+    """
+    Atomically point the CURRENT file at a completed snapshot.
+    Readers either see the previous snapshot or the new one, never a half-written index.
+    """
+    pointer = {
+        "snapshot": os.path.basename(os.path.normpath(snapshot_dir)),
+        "published_at": time.time(),
+    }
+    tmp_path = f"{settings.SNAPSHOT_POINTER_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, settings.SNAPSHOT_POINTER_PATH)
+    prune_snapshots(keep=pointer["snapshot"])
+    return pointer
+
+
+def read_pointer() -> Optional[dict]:
+    """Return the published snapshot pointer, or None if nothing has been published yet"""
+    try:
+        with open(settings.SNAPSHOT_POINTER_PATH, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def resolve_snapshot() -> Tuple[Optional[str], str, str]:
+    """
+    Resolve (snapshot_name, image_faiss_dir, text_faiss_dir) to load.
+    Falls back to the legacy fixed paths (snapshot None) when nothing has been published.
+    """
+    pointer = read_pointer()
+    if pointer:
+        snapshot_dir = os.path.join(settings.SNAPSHOTS_PATH, pointer["snapshot"])
+        if os.path.isdir(snapshot_dir):
+            return (
+                pointer["snapshot"],
+                os.path.join(snapshot_dir, "image_faiss"),
+                os.path.join(snapshot_dir, "text_faiss"),
+            )
+    return None, settings.IMAGE_FAISS_PATH, settings.TEXT_FAISS_PATH
+
+
+def get_index_paths() -> Tuple[str, str]:
+    """Resolve the (image_faiss, text_faiss) directories of the published snapshot"""
+    _, image_path, text_path = resolve_snapshot()
+    return image_path, text_path
+
+
+def prune_snapshots(keep: str):
+    """Delete old snapshots, keeping the newest SNAPSHOTS_TO_KEEP and the published one"""
+    if not os.path.isdir(settings.SNAPSHOTS_PATH):
+        return
+    names = sorted(os.listdir(settings.SNAPSHOTS_PATH), reverse=True)
+    for name in names[settings.SNAPSHOTS_TO_KEEP:]:
+        if name != keep:
+            shutil.rmtree(os.path.join(settings.SNAPSHOTS_PATH, name), ignore_errors=True)
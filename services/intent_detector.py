@@ -14,6 +14,124 @@ class IntentType(Enum):
     IMAGE_REQUEST = "image_request"
     TRACK_ORDER = "track_order"
     BARGAINING = "bargaining"
+    COMPLAINT = "complaint"
+    CANCEL_ORDER = "cancel_order"
+
+# Bangla vowel signs and the hasanta are not word characters for `re`, so a plain \b
+# never matches after words like "জুতা" or "ডেলিভারি". Treat the Bengali block as word characters.
+_WORD = r'[\w\u0980-\u09FF]'
+_BOUNDARY = rf'(?:(?<!{_WORD})(?={_WORD})|(?<={_WORD})(?!{_WORD}))'
+
+
+def compile_intent_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern.replace(r'\b', _BOUNDARY), re.IGNORECASE)
+
+
+_REGEX_SYNTAX = re.compile(r'[.*+?\[\](){}|^$\\]')
+
+
+def _split_alternatives(body: str) -> List[str]:
+    """Split a regex on its top-level '|' only"""
+    parts, depth, current = [], 0, ''
+    for ch in body:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == '|' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        current += ch
+    parts.append(current)
+    return parts
+
+
+def _trie_regex(words: List[str]) -> str:
+    """
+    Regex alternation with shared prefixes factored out, so the engine walks a trie
+    instead of trying every keyword at every position. Longer keywords are tried first.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node) -> str:
+        is_end = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != '']
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if is_end:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class IntentMatcher:
+    """
+    Single-pass matcher over every intent pattern.
+    Each pattern of the form \b(alt1|alt2|...)\b is split into its alternatives:
+    - plain keywords go into one trie-shaped regex that is scanned once over the message
+      (a zero-width lookahead at every position, so overlapping keywords are all seen);
+    - alternatives with regex syntax (how.*much, pai\s*ni) stay separate regexes, run only
+      when the message contains their leading literal.
+    Returns the indices of the patterns that matched; the result is identical to searching
+    every pattern with compile_intent_pattern().
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.pattern_count = len(patterns)
+        keyword_patterns = {}
+        self.residuals = []  # (gate literal, compiled alternative, pattern index)
+
+        for index, pattern in enumerate(patterns):
+            body = pattern
+            if body.startswith(r'\b(') and body.endswith(r')\b'):
+                alternatives = _split_alternatives(body[3:-3])
+            else:
+                alternatives = None
+            if alternatives is None:
+                self.residuals.append(('', compile_intent_pattern(pattern), index))
+                continue
+            for alternative in alternatives:
+                # "pp\b" inside an alternation that already ends in \b
+                keyword = alternative[:-2] if alternative.endswith(r'\b') else alternative
+                if keyword and not _REGEX_SYNTAX.search(keyword):
+                    keyword_patterns.setdefault(keyword.lower(), set()).add(index)
+                else:
+                    gate = re.split(r'[.*+?\[\](){}|^$\\]', alternative, maxsplit=1)[0].lower()
+                    self.residuals.append((gate, compile_intent_pattern(rf'\b({alternative})\b'), index))
+
+        # The scan reports the longest keyword at each position; shorter keywords that end on
+        # a boundary inside it ("কোন" in "কোন সাইজ") are credited through this closure
+        self.keyword_patterns = {}
+        for keyword in keyword_patterns:
+            indices = set(keyword_patterns[keyword])
+            for other, other_indices in keyword_patterns.items():
+                if other != keyword and keyword.startswith(other) and \
+                        compile_intent_pattern(rf'^{re.escape(other)}\b').match(keyword):
+                    indices |= other_indices
+            self.keyword_patterns[keyword] = frozenset(indices)
+
+        words = sorted(self.keyword_patterns)
+        self.keyword_regex = re.compile(
+            rf'(?={_BOUNDARY}({_trie_regex(words)}){_BOUNDARY})', re.IGNORECASE
+        ) if words else None
+
+    def match(self, message_lower: str) -> set:
+        matched = set()
+        if self.keyword_regex is not None:
+            for found in self.keyword_regex.finditer(message_lower):
+                matched |= self.keyword_patterns[found.group(1)]
+        for gate, regex, index in self.residuals:
+            if index not in matched and gate in message_lower and regex.search(message_lower):
+                matched.add(index)
+        return matched
 
 class IntentDetector:
     """Intent detection system to classify user messages and determine appropriate actions"""
@@ -92,8 +210,29 @@ class IntentDetector:
                 r'\b(আসসালামু.*আলাইকুম|assalamu.*alaiikum|সালাম|salam)\b',
                 r'\b(হাই|hi|হ্যালো|hello|হেলো|hey)\b',
                 r'\b(কেমন.*আছেন|how.*are.*you|কি.*খবর|what.*news)\b'
+            ],
+            
+            IntentType.COMPLAINT: [
+                r'\b(পাইনি|হাতে.*পাইনি|paini|pai\s*ni|deri.*hocche|দেরি.*হচ্ছে|দিচ্ছে.*না|dite.*parchhe.*na)\b',
+                r'\b(ভুল.*(bag|shoe|প্রোডাক্ট|ব্যাগ|জুতা)|vul.*product|wrong.*product)\b',
+                r'\b(ড্যামেজ|damage|damaged|নষ্ট|ছেঁড়া|ছিঁড়া|ফাটা|complain|complaint|অভিযোগ|কমপ্লেইন)\b'
+            ],
+            
+            IntentType.CANCEL_ORDER: [
+                r'\b(ক্যান্সেল|cancel|বাতিল|batil)\b',
+                r'\b(অর্ডার.*ক্যান্সেল|order.*cancel|নিবো.*না|nibo.*na|লাগবে.*না|lagbe.*na)\b'
             ]
         }
+        # One flat list of patterns, matched in a single pass by IntentMatcher
+        self.pattern_owners = []  # pattern index -> (IntentType, weight)
+        flat_patterns = []
+        for intent_type, patterns in self.intent_patterns.items():
+            for pattern in patterns:
+                # Give higher score for more specific patterns
+                weight = 0.3 if len(pattern) > 20 else 0.2  # Longer patterns are more specific
+                self.pattern_owners.append((intent_type, weight))
+                flat_patterns.append(pattern)
+        self.matcher = IntentMatcher(flat_patterns)
         
         # Define priority order for intents (higher priority first)
         self.intent_priority = [
@@ -107,6 +246,8 @@ class IntentDetector:
             IntentType.IMAGE_REQUEST,
             IntentType.TRACK_ORDER,
             IntentType.BARGAINING,
+            IntentType.COMPLAINT,
+            IntentType.CANCEL_ORDER,
             IntentType.GENERAL_CHAT
         ]
     
@@ -124,31 +265,7 @@ class IntentDetector:
         if not message or not message.strip():
             return IntentType.GENERAL_CHAT, 0.0
         
-        message_lower = message.lower().strip()
-        intent_scores = {}
-        
-        # If images are present, prioritize product search
-        if has_images:
-            intent_scores[IntentType.PRODUCT_SEARCH] = 0.9
-        
-        # Check each intent pattern
-        for intent_type, patterns in self.intent_patterns.items():
-            score = 0.0
-            matches = 0
-            
-            for pattern in patterns:
-                if re.search(pattern, message_lower, re.IGNORECASE):
-                    matches += 1
-                    # Give higher score for more specific patterns
-                    if len(pattern) > 20:  # Longer patterns are more specific
-                        score += 0.3
-                    else:
-                        score += 0.2
-            
-            # Normalize score based on number of matches
-            if matches > 0:
-                score = min(score, 1.0)  # Cap at 1.0
-                intent_scores[intent_type] = score
+        intent_scores = self.score_intents(message, has_images)
         
         # If no specific intent detected, classify as general chat
         if not intent_scores:
@@ -160,6 +277,43 @@ class IntentDetector:
         
         return best_intent[0], best_intent[1]
     
+    def score_intents(self, message: str, has_images: bool = False) -> Dict[IntentType, float]:
+        """Score every intent whose patterns match the message; intents without a match are omitted"""
+        intent_scores = {}
+        
+        # If images are present, prioritize product search
+        if has_images:
+            intent_scores[IntentType.PRODUCT_SEARCH] = 0.9
+        
+        if not message or not message.strip():
+            return intent_scores
+        
+        message_lower = message.lower().strip()
+        
+        raw_scores = {}
+        for index in self.matcher.match(message_lower):
+            intent_type, weight = self.pattern_owners[index]
+            raw_scores[intent_type] = raw_scores.get(intent_type, 0.0) + weight
+        
+        for intent_type, score in raw_scores.items():
+            score = min(score, 1.0)  # Cap at 1.0
+            intent_scores[intent_type] = max(score, intent_scores.get(intent_type, 0.0))
+        
+        return intent_scores
+    
+    def detect_intents(self, message: str, has_images: bool = False, min_score: float = 0.2) -> List[Tuple[IntentType, float]]:
+        """
+        Detect every intent present in a message (e.g. price and delivery in one question)
+        
+        Returns:
+            List of (IntentType, confidence_score), best first; empty when nothing matched
+        """
+        intent_scores = self.score_intents(message, has_images)
+        return sorted(
+            ((intent, score) for intent, score in intent_scores.items() if score >= min_score),
+            key=lambda x: (-x[1], self.intent_priority.index(x[0]))
+        )
+    
     def should_search_products(self, intent: IntentType, confidence: float) -> bool:
         """
         Determine if product search should be performed based on intent
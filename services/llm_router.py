@@ -0,0 +1,319 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from config.settings import settings
+from services.metrics import percentile
+
+
+class ProviderState:
+    """Rolling latency window and circuit breaker for one LLM provider"""
+
+    def __init__(self, name: str, get_llm: Callable, window: int = settings.LLM_LATENCY_WINDOW):
+        self.name = name
+        self.get_llm = get_llm
+        self.first_token_latencies = deque(maxlen=window)
+        self.total_latencies = deque(maxlen=window)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0  # lost a hedge race or the client went away
+        self.errors = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.usage_reported = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error = None
+
+    def is_available(self, now: float) -> bool:
+        # Once the cool-down has passed the circuit is half-open: the next call is a trial
+        return now >= self.open_until
+
+    def record_success(self, first_token_s: Optional[float], total_s: float, usage: Optional[dict] = None):
+        self.successes += 1
+        if usage:
+            self.usage_reported += 1
+            self.prompt_tokens += usage.get("input_tokens", 0)
+            self.completion_tokens += usage.get("output_tokens", 0)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        if first_token_s is not None:
+            self.first_token_latencies.append(first_token_s)
+        self.total_latencies.append(total_s)
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.errors[type(error).__name__] += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.consecutive_failures >= settings.LLM_CIRCUIT_FAILURE_THRESHOLD:
+            self.open_until = time.monotonic() + settings.LLM_CIRCUIT_COOLDOWN
+            print(f"Circuit opened for LLM provider '{self.name}' for {settings.LLM_CIRCUIT_COOLDOWN:g}s "
+                  f"after {self.consecutive_failures} consecutive failures")
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "errors": dict(self.errors),
+            "consecutive_failures": self.consecutive_failures,
+            "circuit": "closed" if self.consecutive_failures < settings.LLM_CIRCUIT_FAILURE_THRESHOLD
+            else ("open" if now < self.open_until else "half-open"),
+            "circuit_open_for_s": round(max(0.0, self.open_until - now), 1),
+            "first_token_p50_s": percentile(self.first_token_latencies, 50),
+            "first_token_p95_s": percentile(self.first_token_latencies, 95),
+            "total_p50_s": percentile(self.total_latencies, 50),
+            "total_p95_s": percentile(self.total_latencies, 95),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.usage_reported, 1) if self.usage_reported else None,
+            "avg_completion_tokens": round(self.completion_tokens / self.usage_reported, 1) if self.usage_reported else None,
+            "last_error": self.last_error,
+        }
+
+
+class LLMRouter:
+    """
+    Routes prompts across an ordered list of providers (primary first).
+    - Providers with an open circuit breaker are skipped until their cool-down passes.
+    - Hedging: if the current provider has not produced a first token within a deadline
+      derived from its p95 time-to-first-token, the next provider is started as well and
+      whichever wins (first token when streaming, first completion otherwise) is used.
+    - A provider failing before the other has won simply hands over to the next one.
+    Every request is logged on one line and aggregated per provider and per label
+    (the prompt version), with time to first token, latency, tokens and fallback use.
+    """
+
+    def __init__(self, providers: List[Tuple[str, Callable]], hedging: bool = settings.LLM_HEDGING):
+        self.providers = [ProviderState(name, get_llm) for name, get_llm in providers]
+        self.hedging = hedging
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self.fallback_used = 0  # answered by a provider other than the primary
+        self.by_label = OrderedDict()
+
+    def _candidates(self) -> List[ProviderState]:
+        now = time.monotonic()
+        available = [p for p in self.providers if p.is_available(now)]
+        # With every circuit open, trying is still better than failing outright
+        return available or list(self.providers)
+
+    def hedge_deadline(self, provider: ProviderState) -> float:
+        if len(provider.first_token_latencies) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DEFAULT_DELAY
+        p95 = percentile(provider.first_token_latencies, 95)
+        return min(settings.LLM_HEDGE_MAX_DELAY, max(settings.LLM_HEDGE_MIN_DELAY, p95))
+
+    async def _produce(self, provider: ProviderState, prompt_value, queue: asyncio.Queue):
+        """Stream one provider's completion into the shared queue as (provider, kind, payload)"""
+        started = time.perf_counter()
+        first_token_s = None
+        usage = None
+        provider.calls += 1
+        try:
+            llm = provider.get_llm()
+            async for chunk in llm.astream(prompt_value):
+                # With stream_usage the last chunk carries token counts and no text
+                if getattr(chunk, "usage_metadata", None):
+                    usage = chunk.usage_metadata
+                if not chunk.content:
+                    continue
+                if first_token_s is None:
+                    first_token_s = time.perf_counter() - started
+                await queue.put((provider, "chunk", chunk.content))
+            total_s = time.perf_counter() - started
+            provider.record_success(first_token_s, total_s, usage)
+            await queue.put((provider, "end", {"first_token_s": first_token_s, "total_s": total_s, "usage": usage}))
+        except asyncio.CancelledError:
+            provider.cancelled += 1
+            raise
+        except Exception as e:
+            print(f"LLM provider '{provider.name}' failed: {e}")
+            provider.record_failure(e)
+            await queue.put((provider, "error", e))
+
+    def _record_request(self, label: Optional[str], winner: Optional[ProviderState], started: float,
+                        first_token_s: Optional[float], result: Optional[dict], attempts: int, error=None):
+        total_s = time.perf_counter() - started
+        usage = (result or {}).get("usage") or {}
+        fallback = winner is not None and winner is not self.providers[0]
+        self.fallback_used += fallback
+        if winner is None or error is not None:
+            self.failed_requests += 1
+
+        if label is not None:
+            record = self.by_label.setdefault(label, {"requests": 0, "failures": 0, "total_s": 0.0,
+                                                       "prompt_tokens": 0, "completion_tokens": 0})
+            self.by_label.move_to_end(label)
+            record["requests"] += 1
+            record["failures"] += winner is None or error is not None
+            record["total_s"] += total_s
+            record["prompt_tokens"] += usage.get("input_tokens", 0)
+            record["completion_tokens"] += usage.get("output_tokens", 0)
+            while len(self.by_label) > settings.LLM_METRICS_MAX_LABELS:
+                self.by_label.popitem(last=False)
+
+        first_token = f"{first_token_s:.2f}s" if first_token_s is not None else "-"
+        tokens = f"{usage.get('input_tokens', '?')}/{usage.get('output_tokens', '?')}"
+        status = "ok" if error is None and winner is not None else f"error={type(error).__name__}"
+        print(f"LLM request [{label or '-'}]: provider={winner.name if winner else '-'} fallback={fallback} "
+              f"attempts={attempts} first_token={first_token} total={total_s:.2f}s tokens={tokens} {status}")
+
+    async def astream(self, prompt, inputs: dict, commit_on_first_token: bool = True,
+                      label: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Yield (provider_name, text_chunk) from the winning provider.
+        Raises the last error if every provider failed before producing a winner, or the
+        winner's error if it fails mid-stream. `label` (e.g. the prompt version) groups
+        the request in the metrics.
+        """
+        self.requests += 1
+        started = time.perf_counter()
+        first_yield_s = None
+        prompt_value = await prompt.ainvoke(inputs)
+        candidates = self._candidates()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        tasks = {}
+        buffers = {}
+        launched_at = {}  # provider name -> seconds after the request started
+        next_index = 0
+        winner = None
+        hedge_at = None
+        streaming = set()  # providers that have produced a first token
+        overdue = {}  # provider name -> hedge deadline it passed without a first token
+        hedge_delay = None
+        last_error = None
+
+        def launch(hedged: bool = False):
+            nonlocal next_index, hedge_at, hedge_delay
+            provider = candidates[next_index]
+            next_index += 1
+            tasks[provider.name] = asyncio.create_task(self._produce(provider, prompt_value, queue))
+            buffers[provider.name] = []
+            launched_at[provider.name] = time.perf_counter() - started
+            hedge_at = None
+            if self.hedging and next_index < len(candidates):
+                hedge_delay = self.hedge_deadline(provider)
+                hedge_at = loop.time() + hedge_delay
+            if hedged:
+                self.hedges_fired += 1
+                print(f"Hedging: '{provider.name}' started because the previous provider has no first token yet")
+
+        def settle(provider: ProviderState):
+            nonlocal winner
+            winner = provider
+            # The hedge paid off only if it beat a primary that was still running
+            if provider is not candidates[0] and candidates[0].name in tasks:
+                self.hedge_wins += 1
+            for name, task in tasks.items():
+                if name == provider.name:
+                    continue
+                # A loser that never produced a token within its deadline counts as a timeout for
+                # its circuit breaker, so a hung provider is eventually skipped instead of making
+                # every request wait for the hedge; losers that were streaming do not count
+                if name in overdue and name not in streaming and not task.done():
+                    loser = next(p for p in candidates if p.name == name)
+                    loser.record_failure(asyncio.TimeoutError(
+                        f"no first token within {overdue[name]:.1f}s, lost the hedge to '{provider.name}'"
+                    ))
+                task.cancel()
+
+        launch()
+        try:
+            while True:
+                timeout = None
+                if winner is None and hedge_at is not None:
+                    timeout = max(0.0, hedge_at - loop.time())
+                try:
+                    provider, kind, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    overdue[candidates[next_index - 1].name] = hedge_delay
+                    launch(hedged=True)
+                    continue
+
+                if winner is not None and provider is not winner:
+                    continue  # late output from a cancelled loser
+
+                if kind == "chunk":
+                    if provider.name not in streaming:
+                        streaming.add(provider.name)
+                        # The hedge is only for a provider with no first token yet; a slow but
+                        # streaming one (ainvoke waits for completion) is left to finish
+                        hedge_at = None
+                    if winner is None and commit_on_first_token:
+                        settle(provider)
+                    if winner is provider:
+                        if first_yield_s is None:
+                            first_yield_s = time.perf_counter() - started
+                        for text in buffers[provider.name]:
+                            yield provider.name, text
+                        buffers[provider.name] = []
+                        yield provider.name, payload
+                    else:
+                        buffers[provider.name].append(payload)
+                elif kind == "end":
+                    if winner is None:
+                        settle(provider)
+                        if buffers[provider.name] and first_yield_s is None:
+                            first_yield_s = time.perf_counter() - started
+                        for text in buffers[provider.name]:
+                            yield provider.name, text
+                    # ainvoke buffers until the end, so first_yield_s would be the completion time;
+                    # log the winner's own first token, measured from the start of the request
+                    first_token_s = first_yield_s
+                    if payload["first_token_s"] is not None:
+                        first_token_s = launched_at[provider.name] + payload["first_token_s"]
+                    self._record_request(label, winner, started, first_token_s, payload, next_index)
+                    return
+                else:  # error
+                    if winner is provider:
+                        self._record_request(label, winner, started, first_yield_s, None, next_index, payload)
+                        raise payload
+                    last_error = payload
+                    tasks.pop(provider.name, None)
+                    if not any(not task.done() for task in tasks.values()):
+                        if next_index < len(candidates):
+                            launch()
+                        else:
+                            self._record_request(label, None, started, first_yield_s, None, next_index, last_error)
+                            raise last_error
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def ainvoke(self, prompt, inputs: dict, label: Optional[str] = None) -> Tuple[str, str]:
+        """Return (text, provider_name) of the first provider to complete"""
+        parts = []
+        provider_name = None
+        async for provider_name, text in self.astream(prompt, inputs, commit_on_first_token=False, label=label):
+            parts.append(text)
+        return "".join(parts), provider_name
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "fallback_used": self.fallback_used,
+            "fallback_rate": round(self.fallback_used / self.requests, 4) if self.requests else None,
+            "hedging": self.hedging,
+            "hedges_fired": self.hedges_fired,
+            "hedge_wins": self.hedge_wins,
+            "providers": {p.name: p.get_stats() for p in self.providers},
+            "by_label": {
+                label: {
+                    **record,
+                    "total_s": round(record["total_s"], 3),
+                    "avg_total_s": round(record["total_s"] / record["requests"], 3),
+                    "avg_prompt_tokens": round(record["prompt_tokens"] / record["requests"], 1),
+                }
+                for label, record in self.by_label.items()
+            },
+        }
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config.settings import settings
+
+# handler(sender_id, text, files) answers one coalesced chat turn
+Handler = Callable[[str, str, List], Awaitable[None]]
+
+
+class MessageCoalescer:
+    """
+    Per-sender quiet-window buffer for Messenger webhooks.
+    Customers often send "hi", "price?" and a photo within a few seconds; instead of
+    answering each fragment, messages from one sender are buffered until nothing new
+    arrived for `quiet_window` seconds (or `max_wait` since the first one), then texts
+    and attachments are merged into a single chat turn.
+    """
+
+    def __init__(
+        self,
+        quiet_window: float = settings.WEBHOOK_COALESCE_WINDOW,
+        max_wait: float = settings.WEBHOOK_COALESCE_MAX_WAIT,
+    ):
+        self.quiet_window = quiet_window
+        self.max_wait = max_wait
+        self.handler: Optional[Handler] = None
+        self._buffers: Dict[str, dict] = {}
+        self._tasks = set()
+        self.stats = {"messages_in": 0, "turns_out": 0, "coalesced_messages": 0, "handler_errors": 0}
+
+    def set_handler(self, handler: Handler):
+        self.handler = handler
+
+    async def add(self, sender_id: str, text: str, files: List):
+        """Buffer one incoming message; the merged turn is handled in the background"""
+        self.stats["messages_in"] += 1
+        if self.quiet_window <= 0:
+            await self._handle(sender_id, text, files, 1)
+            return
+
+        buffer = self._buffers.get(sender_id)
+        if buffer is None:
+            buffer = {"texts": [], "files": [], "count": 0, "first_at": time.monotonic(), "timer": None}
+            self._buffers[sender_id] = buffer
+        if text:
+            buffer["texts"].append(text)
+        buffer["files"].extend(files)
+        buffer["count"] += 1
+
+        if buffer["timer"] is not None:
+            buffer["timer"].cancel()
+        remaining = self.max_wait - (time.monotonic() - buffer["first_at"])
+        buffer["timer"] = self._spawn(self._flush_later(sender_id, max(0.0, min(self.quiet_window, remaining))))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self, sender_id: str, delay: float):
+        await asyncio.sleep(delay)
+        # Nothing awaits between here and the pop, so a cancel can only land during the sleep
+        buffer = self._buffers.pop(sender_id, None)
+        if buffer is not None:
+            await self._handle(sender_id, "\n".join(buffer["texts"]), buffer["files"], buffer["count"])
+
+    async def _handle(self, sender_id: str, text: str, files: List, count: int):
+        self.stats["turns_out"] += 1
+        if count > 1:
+            self.stats["coalesced_messages"] += count
+            print(f"Coalesced {count} messages from {sender_id} into one chat turn")
+        try:
+            await self.handler(sender_id, text, files)
+        except Exception as e:
+            self.stats["handler_errors"] += 1
+            print(f"Error handling messages from {sender_id}: {e}")
+
+    async def drain(self):
+        """Flush every buffered sender now (used on shutdown)"""
+        for sender_id in list(self._buffers):
+            buffer = self._buffers.pop(sender_id)
+            buffer["timer"].cancel()
+            await self._handle(sender_id, "\n".join(buffer["texts"]), buffer["files"], buffer["count"])
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "quiet_window_s": self.quiet_window,
+            "buffered_senders": len(self._buffers),
+            "chat_turns_saved": self.stats["messages_in"] - self.stats["turns_out"]
+            - sum(buffer["count"] for buffer in self._buffers.values()),
+        }
+
+
+# Global message coalescer instance; the webhook route installs the handler
+message_coalescer = MessageCoalescer()
@@ -0,0 +1,194 @@
+import asyncio
+import random
+import time
+from collections import Counter, deque
+from typing import Deque, Dict
+
+import httpx
+
+from config.settings import settings
+from services.http_client import http_client
+from services.metrics import percentile
+
+# Graph API rate-limit codes: the message was refused, so sending it again is safe
+TRANSIENT_GRAPH_CODES = {4, 17, 341, 613}
+# Errors raised before the request reached Facebook. A read timeout or a dropped response
+# may come after the message was delivered, so those are not retried (no duplicate replies)
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# A message ends the typing indicator, so these are dropped when one is queued behind them
+TYPING_ACTIONS = ("typing_on", "typing_off")
+
+
+class TokenBucket:
+    """Global send rate limit: `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the seconds waited"""
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return now - started
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessengerSender:
+    """
+    Outbound dispatcher for the Messenger Send API.
+    Replies and sender actions are queued per recipient and delivered in order by one
+    task per recipient, so different customers are served in parallel. Every request
+    passes a global token bucket. Connection failures, 429/5xx and Graph rate-limit codes
+    are retried with full-jitter exponential backoff; other network errors are not,
+    since the message may already have been delivered. A sender action is skipped if the
+    same one is already waiting, and a waiting typing indicator is dropped once a
+    message is queued behind it.
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.MESSENGER_SEND_RATE,
+        burst: float = settings.MESSENGER_SEND_BURST,
+        max_retries: int = settings.MESSENGER_SEND_MAX_RETRIES,
+        backoff: float = settings.MESSENGER_SEND_BACKOFF,
+        backoff_max: float = settings.MESSENGER_SEND_BACKOFF_MAX,
+        window: int = 1000,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._queues: Dict[str, Deque[dict]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.send_latencies = deque(maxlen=window)  # queued -> delivered
+        self.api_latencies = deque(maxlen=window)  # one Graph API request
+        self.max_depth = 0
+        self.stats = Counter()
+
+    def send_text(self, recipient_id: str, text: str):
+        self._enqueue(recipient_id, "text", {
+            "messaging_type": "RESPONSE",
+            "recipient": {"id": recipient_id},
+            "message": {"text": text},
+        })
+
+    def send_image(self, recipient_id: str, image_url: str):
+        self._enqueue(recipient_id, "image", {
+            "messaging_type": "RESPONSE",
+            "recipient": {"id": recipient_id},
+            "message": {"attachment": {"type": "image", "payload": {"url": image_url, "is_reusable": True}}},
+        })
+
+    def send_action(self, recipient_id: str, action: str):
+        """Queue a sender action ("mark_seen", "typing_on", "typing_off")"""
+        queue = self._queues.get(recipient_id)
+        if queue and any(item["kind"] == action for item in queue):
+            self.stats["actions_coalesced"] += 1
+            return
+        self._enqueue(recipient_id, action, {"recipient": {"id": recipient_id}, "sender_action": action})
+
+    def _enqueue(self, recipient_id: str, kind: str, payload: dict):
+        queue = self._queues.get(recipient_id)
+        if queue is None:
+            queue = deque()
+            self._queues[recipient_id] = queue
+        if kind in ("text", "image"):
+            waiting = len(queue)
+            for item in [item for item in queue if item["kind"] in TYPING_ACTIONS]:
+                queue.remove(item)
+            self.stats["actions_coalesced"] += waiting - len(queue)
+        queue.append({"kind": kind, "payload": payload, "queued_at": time.monotonic()})
+        self.stats[f"queued_{kind}"] += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        if recipient_id not in self._workers:
+            self._workers[recipient_id] = asyncio.create_task(self._run(recipient_id))
+
+    async def _run(self, recipient_id: str):
+        queue = self._queues[recipient_id]
+        try:
+            while queue:
+                item = queue.popleft()
+                if await self._deliver(item):
+                    self.stats[f"sent_{item['kind']}"] += 1
+                    self.send_latencies.append(time.monotonic() - item["queued_at"])
+                else:
+                    self.stats[f"failed_{item['kind']}"] += 1
+        finally:
+            # Nothing awaits between the empty check and here, so no item can be stranded
+            del self._queues[recipient_id]
+            del self._workers[recipient_id]
+
+    async def _deliver(self, item: dict) -> bool:
+        for attempt in range(self.max_retries + 1):
+            waited = await self.bucket.acquire()
+            if waited:
+                self.stats["rate_limited_s"] += round(waited, 3)
+            started = time.monotonic()
+            retry_after = None
+            try:
+                response = await http_client.get().post(settings.FB_GRAPH_URL, json=item["payload"])
+                self.api_latencies.append(time.monotonic() - started)
+                if response.status_code == 200:
+                    return True
+                transient, error = self._classify(response)
+                retry_after = response.headers.get("Retry-After")
+            except httpx.HTTPError as e:
+                transient, error = isinstance(e, UNSENT_ERRORS), f"{type(e).__name__}: {e}"
+
+            if not transient or attempt == self.max_retries:
+                print(f"Messenger {item['kind']} to {item['payload']['recipient']['id']} failed: {error}")
+                return False
+            self.stats["retries"] += 1
+            delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            await asyncio.sleep(delay)
+        return False
+
+    @staticmethod
+    def _classify(response: httpx.Response):
+        """(is the failure transient, error text) for a non-200 Graph API response"""
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            error = {}
+        code = error.get("code")
+        transient = response.status_code == 429 or response.status_code >= 500 or code in TRANSIENT_GRAPH_CODES
+        return transient, f"{response.status_code} {error.get('message') or response.text[:200]}"
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self, timeout: float = settings.WEBHOOK_SHUTDOWN_TIMEOUT):
+        """Wait for queued messages to go out (used on shutdown)"""
+        if not self._workers:
+            return
+        done, pending = await asyncio.wait(list(self._workers.values()), timeout=timeout)
+        if pending:
+            print(f"Messenger sender: {self.depth()} messages still queued after {timeout}s")
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "active_recipients": len(self._workers),
+            "send_latency_p50_s": percentile(self.send_latencies, 50),
+            "send_latency_p95_s": percentile(self.send_latencies, 95),
+            "api_latency_p50_s": percentile(self.api_latencies, 50),
+            "api_latency_p95_s": percentile(self.api_latencies, 95),
+        }
+
+
+# Global outbound Messenger dispatcher
+messenger_sender = MessengerSender()
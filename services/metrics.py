@@ -0,0 +1,10 @@
+from typing import Optional
+
+
+def percentile(values, pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a latency window; None while it is empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
@@ -1,13 +1,16 @@
 import json
 import faiss
+import httpx
 import numpy as np
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import torch
 from langchain_community.vectorstores import FAISS as LangchainFAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 from config.settings import settings
+from services.index_snapshots import resolve_snapshot
+from services.text_indexer import create_e5_embeddings
+from services.llm_router import LLMRouter
 from typing import Optional
 from ultralytics import YOLO
 
@@ -34,8 +37,14 @@ class ModelManager:
             'image_metadata': None,
             'llm': None,
             'fallback_llm': None,
-            'object_detector': None
+            'llm_http_client': None,
+            'llm_http_async_client': None,
+            'object_detector': None,
+            'index_paths': None
         }
+        self.loaded_snapshot = None
+        self._llm_router = None
+        self._product_lookup = (None, {})  # (image metadata it was built from, id -> product)
         self.TARGET_CLASSES = {24, 26, 28}
     
     def get_clip_model(self):
@@ -56,15 +65,23 @@ class ModelManager:
         """Lazy load text embeddings model"""
         if self._models['embeddings'] is None:
             print("Loading text embeddings model...")
-            self._models['embeddings'] = HuggingFaceEmbeddings(model_name=settings.TEXT_EMBEDDING_MODEL)
+            self._models['embeddings'] = create_e5_embeddings()
         return self._models['embeddings']
     
+    def _get_index_paths(self):
+        """Resolve the snapshot once, so all lazily loaded indexes come from the same training run"""
+        if self._models['index_paths'] is None:
+            self._models['index_paths'] = resolve_snapshot()
+            self.loaded_snapshot = self._models['index_paths'][0]
+        return self._models['index_paths']
+    
     def get_image_index(self):
         """Lazy load image FAISS index"""
         if self._models['image_index'] is None:
             print("Loading image FAISS index...")
             try:
-                self._models['image_index'] = faiss.read_index(f'{settings.IMAGE_FAISS_PATH}/image.index')
+                _, image_path, _ = self._get_index_paths()
+                self._models['image_index'] = faiss.read_index(f'{image_path}/image.index')
             except Exception as e:
                 print(f"Warning: Could not load image index: {e}")
                 self._models['image_index'] = None
@@ -76,8 +93,9 @@ class ModelManager:
             print("Loading text vector store...")
             try:
                 embeddings = self.get_embeddings()
+                _, _, text_path = self._get_index_paths()
                 self._models['text_vector_store'] = LangchainFAISS.load_local(
-                    settings.TEXT_FAISS_PATH, embeddings, allow_dangerous_deserialization=True
+                    text_path, embeddings, allow_dangerous_deserialization=True
                 )
             except Exception as e:
                 print(f"Warning: Could not load text vector store: {e}")
@@ -89,23 +107,74 @@ class ModelManager:
         if self._models['image_metadata'] is None:
             print("Loading image metadata...")
             try:
-                with open(f'{settings.IMAGE_FAISS_PATH}/image_metadata.json', 'r') as f:
+                _, image_path, _ = self._get_index_paths()
+                with open(f'{image_path}/image_metadata.json', 'r') as f:
                     self._models['image_metadata'] = json.load(f)
             except Exception as e:
                 print(f"Warning: Could not load image metadata: {e}")
                 self._models['image_metadata'] = []
         return self._models['image_metadata']
     
+    @staticmethod
+    def expand_image_match(product: dict) -> list:
+        """
+        The product an image search matched, followed by the products whose duplicate
+        images training merged into the same vector (each with its own name and price)
+        """
+        variants = product.get('variants')
+        if not variants:
+            return [product]
+        return [{k: v for k, v in product.items() if k != 'variants'}] + variants
+    
+    def get_products_by_ids(self, product_ids) -> list:
+        """Product dicts from the image metadata for the given ids; unknown ids are skipped"""
+        metadata = self.get_image_metadata()
+        if self._product_lookup[0] is not metadata:
+            # Rebuilt whenever a reload swaps in new metadata; merged variants are included
+            lookup = {}
+            for entry in metadata:
+                for product in self.expand_image_match(entry):
+                    lookup.setdefault(product.get('id'), product)
+            self._product_lookup = (metadata, lookup)
+        lookup = self._product_lookup[1]
+        return [lookup[pid] for pid in product_ids if pid in lookup]
+    
+    def get_llm_http_clients(self):
+        """Shared keep-alive HTTP clients (sync, async) for all LLM providers"""
+        if self._models['llm_http_async_client'] is None:
+            print("Creating shared LLM HTTP connection pool...")
+            limits = httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY
+            )
+            timeout = httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT)
+            self._models['llm_http_client'] = httpx.Client(limits=limits, timeout=timeout)
+            self._models['llm_http_async_client'] = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return self._models['llm_http_client'], self._models['llm_http_async_client']
+    
+    def _create_chat_model(self, model: str, api_key: Optional[str], base_url: str) -> ChatOpenAI:
+        http_client, http_async_client = self.get_llm_http_clients()
+        return ChatOpenAI(
+            model=model,
+            openai_api_key=api_key,
+            openai_api_base=base_url,
+            max_tokens=settings.LLM_MAX_TOKENS,
+            temperature=settings.LLM_TEMPERATURE,
+            timeout=settings.LLM_HTTP_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            # Report token usage on streamed responses too (read by the LLM router metrics)
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client
+        )
+    
     def get_llm(self):
         """Lazy load LLM"""
         if self._models['llm'] is None:
             print(f"Loading Grok LLM: {settings.LLM_MODEL}...")
-            self._models['llm'] = ChatOpenAI(
-                model=settings.LLM_MODEL,
-                openai_api_key=settings.LLM_API_KEY,
-                openai_api_base=settings.LLM_BASE_URL,
-                max_tokens=settings.LLM_MAX_TOKENS,
-                temperature=settings.LLM_TEMPERATURE
+            self._models['llm'] = self._create_chat_model(
+                settings.LLM_MODEL, settings.LLM_API_KEY, settings.LLM_BASE_URL
             )
         return self._models['llm']
     
@@ -114,15 +183,20 @@ class ModelManager:
         if self._models['fallback_llm'] is None:
             print("Loading Fallback LLM...")
             print(f"Loading Fallback LLM: {settings.FALLBACK_LLM_MODEL}...")
-            self._models['fallback_llm'] = ChatOpenAI(
-                model=settings.FALLBACK_LLM_MODEL,
-                openai_api_key=settings.FALLBACK_LLM_API_KEY,
-                openai_api_base=settings.FALLBACK_LLM_BASE_URL,
-                max_tokens=settings.LLM_MAX_TOKENS,
-                temperature=settings.LLM_TEMPERATURE
+            self._models['fallback_llm'] = self._create_chat_model(
+                settings.FALLBACK_LLM_MODEL, settings.FALLBACK_LLM_API_KEY, settings.FALLBACK_LLM_BASE_URL
             )
         return self._models['fallback_llm']
     
+    def get_llm_router(self) -> LLMRouter:
+        """Router over primary and fallback LLMs with latency tracking, circuit breaker and hedging"""
+        if self._llm_router is None:
+            self._llm_router = LLMRouter([
+                ("primary", self.get_llm),
+                ("fallback", self.get_fallback_llm)
+            ])
+        return self._llm_router
+    
     def get_object_detector(self):
         """Lazy load YOLO object detector"""
         if self._models['object_detector'] is None:
@@ -168,15 +242,30 @@ class ModelManager:
         return embedding.cpu().numpy().flatten()
     
     def reload_vector_stores(self):
-        """Reloads the vector stores and metadata from disk."""
+        """
+        Reloads the vector stores and metadata of the published snapshot from disk.
+        The new indexes are fully loaded before being swapped in, so requests served
+        during a reload keep using the previous ones. Returns the loaded snapshot name.
+        """
         print("Reloading vector stores...")
-        self._models['image_index'] = None
-        self._models['text_vector_store'] = None
-        self._models['image_metadata'] = None
-        self.get_image_index()
-        self.get_text_vector_store()
-        self.get_image_metadata()
-        print("OK: Vector stores reloaded.")
+        index_paths = resolve_snapshot()
+        snapshot, image_path, text_path = index_paths
+        image_index = faiss.read_index(f'{image_path}/image.index')
+        text_vector_store = LangchainFAISS.load_local(
+            text_path, self.get_embeddings(), allow_dangerous_deserialization=True
+        )
+        with open(f'{image_path}/image_metadata.json', 'r') as f:
+            image_metadata = json.load(f)
+        
+        self._models.update({
+            'index_paths': index_paths,
+            'image_index': image_index,
+            'text_vector_store': text_vector_store,
+            'image_metadata': image_metadata
+        })
+        self.loaded_snapshot = snapshot
+        print(f"OK: Vector stores reloaded (snapshot: {snapshot or 'legacy'}).")
+        return snapshot
     
     def preload_essential_models(self):
         """Preload only essential models for basic functionality"""
@@ -196,6 +285,17 @@ class ModelManager:
         self.get_llm()
         self.get_fallback_llm()
     
+    async def aclose_http_clients(self):
+        """Close the shared LLM connection pool"""
+        if self._models['llm_http_async_client'] is not None:
+            await self._models['llm_http_async_client'].aclose()
+        if self._models['llm_http_client'] is not None:
+            self._models['llm_http_client'].close()
+        self._models['llm_http_client'] = None
+        self._models['llm_http_async_client'] = None
+        self._models['llm'] = None
+        self._models['fallback_llm'] = None
+    
     def clear_models(self):
         """Clear all loaded models to free memory"""
         print("Clearing models from memory...")
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from config.settings import settings
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+_BANGLA_DIGITS = str.maketrans("০১২৩৪৫৬৭৮৯", "0123456789")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a user query"""
+    query = unicodedata.normalize("NFC", query).lower().translate(_BANGLA_DIGITS)
+    query = _PUNCTUATION.sub(" ", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM replies for FAQ-style questions.
+    Entries are keyed by (normalized query, retrieved product ids, prompt version, hash of
+    the product context), so a retrain or a price/description change is a miss at once:
+    - exact tier: identical normalized query
+    - semantic tier: e5 query embedding with cosine similarity >= threshold, looked up
+      only among entries with the same product ids, prompt version and product data
+    Entries expire after a TTL and the least recently used ones are evicted first.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = settings.RESPONSE_CACHE_TTL,
+        similarity: float = settings.RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> {"reply", "expires_at", "embedding"}
+        self._buckets = defaultdict(dict)  # (product_ids, prompt_version, context hash) -> {key: embedding}
+        self.stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                      "stores": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def _embed(text: str) -> np.ndarray:
+        from services.model_manager import model_manager
+
+        vector = np.asarray(model_manager.get_embeddings().embed_query(text), dtype="float32")
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        bucket = self._buckets.get(key[1:])
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._buckets[key[1:]]
+
+    def _get_live(self, key) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def lookup(self, query: str, product_ids: Iterable, prompt_version: str, context: str = "") -> dict:
+        """
+        Returns {"reply", "tier", "key", "embedding"}; reply is None on a miss.
+        Pass the result to store() after the LLM answered, to reuse key and embedding.
+        """
+        self.stats["lookups"] += 1
+        normalized = normalize_query(query)
+        context_hash = hashlib.sha1(context.encode("utf-8")).hexdigest()[:12]
+        key = (normalized, tuple(sorted(str(pid) for pid in product_ids)), prompt_version, context_hash)
+        result = {"reply": None, "tier": None, "key": key, "embedding": None}
+
+        entry = self._get_live(key)
+        if entry is not None:
+            self.stats["exact_hits"] += 1
+            result.update(reply=entry["reply"], tier="exact")
+            return result
+
+        if self.similarity and normalized:
+            # Embedding is CPU work; keep the event loop free
+            embedding = await asyncio.to_thread(self._embed, normalized)
+            result["embedding"] = embedding
+            bucket = self._buckets.get(key[1:])
+            if bucket:
+                keys = list(bucket.keys())
+                scores = np.stack([bucket[k] for k in keys]) @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    entry = self._get_live(keys[best])
+                    if entry is not None:
+                        self.stats["semantic_hits"] += 1
+                        result.update(reply=entry["reply"], tier="semantic")
+                        return result
+
+        self.stats["misses"] += 1
+        return result
+
+    def store(self, lookup: dict, reply: str):
+        key = lookup["key"]
+        self._remove(key)
+        self._entries[key] = {
+            "reply": reply,
+            "expires_at": time.monotonic() + self.ttl,
+        }
+        if lookup["embedding"] is not None:
+            self._buckets[key[1:]][key] = lookup["embedding"]
+        self.stats["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "exact_hit_rate": round(self.stats["exact_hits"] / lookups, 4) if lookups else None,
+            "semantic_hit_rate": round(self.stats["semantic_hits"] / lookups, 4) if lookups else None,
+            "hit_rate": round((self.stats["exact_hits"] + self.stats["semantic_hits"]) / lookups, 4) if lookups else None,
+        }
+
+
+# Global response cache instance
+response_cache = ResponseCache()
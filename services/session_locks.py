@@ -0,0 +1,93 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+from services.metrics import percentile
+
+
+class SessionLease:
+    """A held session lock; `release` may be called more than once"""
+
+    __slots__ = ("_locks", "session_id", "released")
+
+    def __init__(self, locks: "SessionLocks", session_id: str):
+        self._locks = locks
+        self.session_id = session_id
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._locks._release(self.session_id)
+
+
+class SessionLocks:
+    """
+    Per-session asyncio locks, so turns of one conversation run one at a time (in
+    arrival order) while different sessions run fully in parallel. A lock only
+    exists while someone holds or waits for it. Wait times are kept for the metrics.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._locks: Dict[str, List] = {}  # session_id -> [lock, holders and waiters]
+        self.waits = deque(maxlen=window)
+        self.acquired = 0
+        self.contended = 0
+        self.max_wait = 0.0
+
+    async def acquire(self, session_id: str) -> SessionLease:
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self._locks[session_id] = entry
+        entry[1] += 1
+        contended = entry[0].locked()
+        started = time.perf_counter()
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget(session_id, entry)
+            raise
+
+        wait = time.perf_counter() - started
+        self.acquired += 1
+        self.waits.append(wait)
+        self.max_wait = max(self.max_wait, wait)
+        if contended:
+            self.contended += 1
+            print(f"Session {session_id} waited {wait:.2f}s for its previous turn")
+        return SessionLease(self, session_id)
+
+    def _release(self, session_id: str):
+        entry = self._locks[session_id]
+        entry[0].release()
+        self._forget(session_id, entry)
+
+    def _forget(self, session_id: str, entry: List):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        lease = await self.acquire(session_id)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "locked_sessions": len(self._locks),
+            "wait_p50_s": percentile(self.waits, 50),
+            "wait_p95_s": percentile(self.waits, 95),
+            "wait_max_s": round(self.max_wait, 4),
+        }
+
+
+# Global session lock registry
+session_locks = SessionLocks()
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from services.conversation_memory import TokenBudgetMemory
+
+# Late summary writes run as background tasks; keep references so they are not garbage collected
+_background_tasks = set()
+
+
+class Session:
+    """
+    Compact state of one conversation: the token-budgeted memory (turns are plain
+    tuples), the ids of the products last discussed and a message counter.
+    `version` counts saves, so a late write can detect that another worker moved on.
+    """
+
+    __slots__ = ("memory", "product_ids", "message_count", "last_seen", "version")
+
+    def __init__(self):
+        self.memory = TokenBudgetMemory()
+        self.product_ids: Tuple = ()
+        self.message_count = 0
+        self.last_seen = time.time()
+        self.version = 0
+
+    def set_products(self, products: Iterable[dict]):
+        self.product_ids = tuple(product.get("id") for product in products if product.get("id") is not None)
+
+    def get_products(self) -> List[dict]:
+        from services.model_manager import model_manager
+
+        return model_manager.get_products_by_ids(self.product_ids) if self.product_ids else []
+
+
+def estimate_size(value) -> int:
+    """Rough deep size in bytes of strings, numbers and the containers holding them"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+
+def session_size(session_id: str, session: Session) -> int:
+    memory = session.memory
+    return (estimate_size(session_id) + sys.getsizeof(session) + sys.getsizeof(memory)
+            + estimate_size(session.product_ids) + estimate_size(memory.summary)
+            + estimate_size(memory.turns) + estimate_size(memory.pending))
+
+
+class MemorySessionBackend:
+    """
+    In-process backend: sessions stay live objects in least-recently-used order.
+    A session idle for `idle_ttl` seconds expires, and beyond `max_sessions` the
+    least recently used one is evicted. Only suitable for a single worker.
+    """
+
+    shared = False
+    blocking = False
+
+    def __init__(self, max_sessions: int, idle_ttl: float):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.stats = {"expired": 0, "evicted": 0, "conflicts": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def load(self, session_id: str) -> Optional[Session]:
+        self._evict(time.time())
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def save(self, session_id: str, session: Session, if_version: Optional[int] = None) -> bool:
+        """Same contract as SQLiteSessionBackend.save (a missing session counts as version 0)"""
+        if if_version is not None:
+            current = self._sessions.get(session_id)
+            if (current.version if current is not None else 0) != if_version:
+                self.stats["conflicts"] += 1
+                return False
+        session.version += 1
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self._evict(time.time())
+        return True
+
+    def _evict(self, now: float):
+        # The oldest entry is also the longest idle, so expiry stops at the first live one
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen > self.idle_ttl:
+                self.stats["expired"] += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._sessions[session_id]
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes held by all sessions (walks every session; meant for the stats endpoint)"""
+        return sum(session_size(session_id, session) for session_id, session in self._sessions.items())
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "memory_estimate_bytes": self.memory_estimate()}
+
+
+class SQLiteSessionBackend:
+    """
+    Shared backend for several uvicorn workers on one host: pickled sessions in a
+    SQLite database in WAL mode, so readers never wait for the writer.
+    Expired and over-capacity sessions are deleted every `CLEANUP_EVERY` saves.
+    """
+
+    shared = True
+    blocking = True
+    CLEANUP_EVERY = 200
+
+    def __init__(self, path: str, max_sessions: int, idle_ttl: float):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.stats = {"expired": 0, "evicted": 0, "conflicts": 0, "bytes_written": 0}
+        self._saves = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, version INTEGER NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def load(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version, last_seen FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.idle_ttl:
+            return None
+        session = pickle.loads(row[0])
+        session.version = row[1]
+        return session
+
+    def save(self, session_id: str, session: Session, if_version: Optional[int] = None) -> bool:
+        """
+        Write the session. With `if_version` the write only happens if the stored
+        session is still at that version (returns False otherwise); version 0 means a new
+        session, which may also replace an expired row. Check and write are one statement,
+        so two workers can never both succeed from the same version.
+        """
+        data = pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if if_version is None:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, data, version, last_seen) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, "
+                    "version = sessions.version + 1, last_seen = excluded.last_seen",
+                    (session_id, data, session.version + 1, session.last_seen),
+                )
+                updated = 1
+            elif if_version == 0:
+                updated = self._conn.execute(
+                    "INSERT INTO sessions (id, data, version, last_seen) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, "
+                    "version = sessions.version + 1, last_seen = excluded.last_seen "
+                    "WHERE sessions.last_seen < ?",
+                    (session_id, data, session.last_seen, time.time() - self.idle_ttl),
+                ).rowcount
+            else:
+                updated = self._conn.execute(
+                    "UPDATE sessions SET data = ?, version = version + 1, last_seen = ? WHERE id = ? AND version = ?",
+                    (data, session.last_seen, session_id, if_version),
+                ).rowcount
+            if not updated:
+                self.stats["conflicts"] += 1
+                return False
+            version = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            self.stats["bytes_written"] += len(data)
+            self._saves += 1
+            if self._saves % self.CLEANUP_EVERY == 0:
+                self._cleanup()
+        session.version = version
+        return True
+
+    def _cleanup(self):
+        self.stats["expired"] += self._conn.execute(
+            "DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.idle_ttl,)
+        ).rowcount
+        self.stats["evicted"] += self._conn.execute(
+            "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        ).rowcount
+
+    def memory_estimate(self) -> int:
+        """Bytes of pickled session data in the database"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sessions").fetchone()[0]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "path": self.path, "stored_bytes": self.memory_estimate()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_backend(name: str = settings.SESSION_BACKEND):
+    if name == "sqlite":
+        return SQLiteSessionBackend(settings.SESSION_SQLITE_PATH, settings.SESSION_MAX_ENTRIES, settings.SESSION_IDLE_TTL)
+    if name != "memory":
+        print(f"Warning: Unknown SESSION_BACKEND '{name}', using in-process sessions")
+    return MemorySessionBackend(settings.SESSION_MAX_ENTRIES, settings.SESSION_IDLE_TTL)
+
+
+class SessionStore:
+    """
+    Session store used by the chat routes, replacing the never-evicting defaultdict.
+    Each chat turn does one `load` at its start and one `save` at its end; the backend
+    decides where sessions live (see SESSION_BACKEND). Blocking backends run in a thread.
+    The save is conditional on the version that was loaded. Session locks are per
+    process, so another worker may have finished a turn of the same conversation in
+    between; then the latest copy is reloaded, the turn is replayed onto it and saved again.
+    """
+
+    SAVE_ATTEMPTS = 3
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else create_backend()
+        self.stats = {"loads": 0, "created": 0, "saves": 0, "replayed": 0, "lost": 0}
+
+    async def _call(self, func, *args, **kwargs):
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def load(self, session_id: str) -> Session:
+        """The session for `session_id`, created if missing or expired"""
+        self.stats["loads"] += 1
+        session = await self._call(self.backend.load, session_id)
+        if session is None:
+            session = Session()
+            self.stats["created"] += 1
+        session.last_seen = time.time()
+        return session
+
+    async def save(self, session_id: str, session: Session, replay: Callable[[Session], None]) -> Session:
+        """
+        Save a session loaded by `load` and changed by one turn. `replay` re-applies the
+        turn's changes to a freshly loaded copy after a conflict. Returns the saved session.
+        """
+        self.stats["saves"] += 1
+        for attempt in range(self.SAVE_ATTEMPTS):
+            if await self._call(self.backend.save, session_id, session, if_version=session.version):
+                break
+            if attempt == self.SAVE_ATTEMPTS - 1:
+                self.stats["lost"] += 1
+                print(f"Session {session_id}: gave up saving after {self.SAVE_ATTEMPTS} conflicting writes")
+                return session
+            self.stats["replayed"] += 1
+            print(f"Session {session_id} was saved elsewhere during this turn; replaying the turn onto it")
+            session = await self.load(session_id)
+            replay(session)
+
+        if self.backend.shared:
+            # A summary that lands after the turn was saved is written back, unless the
+            # conversation has moved on (e.g. on another worker) in the meantime
+            version = session.version
+            session.memory.on_summary = lambda: self._save_summary(session_id, session, version)
+        return session
+
+    def _save_summary(self, session_id: str, session: Session, version: int):
+        task = asyncio.get_running_loop().create_task(self._write_summary(session_id, session, version))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    async def _write_summary(self, session_id: str, session: Session, version: int):
+        try:
+            await self._call(self.backend.save, session_id, session, if_version=version)
+        except Exception as e:
+            print(f"Error saving session summary: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "backend": type(self.backend).__name__,
+            "sessions": len(self.backend),
+            "max_sessions": self.backend.max_sessions,
+            "idle_ttl_s": self.backend.idle_ttl,
+            **self.backend.get_stats(),
+        }
+
+    def close(self):
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+
+# Global session store instance
+session_store = SessionStore()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import List, Optional
+
+from config.settings import settings
+from services.index_snapshots import read_pointer
+
+
+class SnapshotWatcher:
+    """
+    Per-worker watcher that polls the published snapshot pointer (mtime) and
+    hot-reloads the vector stores when training publishes a new snapshot.
+    Every worker runs its own watcher, so a multi-worker deployment picks up a new
+    index without any network call. Each worker reports its state to a status file.
+    """
+
+    HEARTBEAT_EVERY = 5  # polls between status file refreshes when nothing changes
+
+    def __init__(self, poll_interval: float = settings.SNAPSHOT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.status_file = os.path.join(settings.WORKER_STATUS_PATH, f"{self.worker_id}.json")
+        self._task: Optional[asyncio.Task] = None
+        self._last_mtime = None
+        self.reloads = 0
+        self.last_reload_at = None
+        self.last_error = None
+
+    def _pointer_mtime(self):
+        try:
+            return os.stat(settings.SNAPSHOT_POINTER_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._last_mtime = self._pointer_mtime()
+        self._write_status()
+        self._task = asyncio.create_task(self._run())
+        print(f"OK: Snapshot watcher started for worker {self.worker_id}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            os.remove(self.status_file)
+        except FileNotFoundError:
+            pass
+
+    async def _run(self):
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            polls += 1
+            mtime = self._pointer_mtime()
+            if mtime is not None and mtime != self._last_mtime:
+                self._last_mtime = mtime
+                await self.check_and_reload()
+            elif polls % self.HEARTBEAT_EVERY == 0:
+                self._write_status()
+
+    async def check_and_reload(self):
+        """Reload this worker's vector stores if the published snapshot differs from the loaded one"""
+        from services.model_manager import model_manager
+
+        pointer = read_pointer()
+        if not pointer:
+            return
+        # Nothing loaded yet: the next lazy load resolves the new pointer by itself
+        if model_manager.loaded_snapshot is None and model_manager._models['index_paths'] is None:
+            self._write_status()
+            return
+        if pointer["snapshot"] == model_manager.loaded_snapshot:
+            self._write_status()
+            return
+
+        print(f"Worker {self.worker_id}: new snapshot {pointer['snapshot']} published, reloading...")
+        try:
+            # Loading indexes is blocking disk/CPU work; keep the event loop serving requests
+            await asyncio.to_thread(model_manager.reload_vector_stores)
+            self.reloads += 1
+            self.last_reload_at = time.time()
+            self.last_error = None
+        except Exception as e:
+            print(f"Worker {self.worker_id}: failed to reload snapshot {pointer['snapshot']}: {e}")
+            self.last_error = str(e)
+        self._write_status()
+
+    def get_status(self) -> dict:
+        from services.model_manager import model_manager
+
+        pointer = read_pointer()
+        return {
+            "worker_id": self.worker_id,
+            "pid": os.getpid(),
+            "loaded_snapshot": model_manager.loaded_snapshot,
+            "published_snapshot": pointer["snapshot"] if pointer else None,
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+            "heartbeat_at": time.time(),
+        }
+
+    def _write_status(self):
+        try:
+            os.makedirs(settings.WORKER_STATUS_PATH, exist_ok=True)
+            tmp_path = f"{self.status_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.get_status(), f)
+            os.replace(tmp_path, self.status_file)
+        except OSError as e:
+            print(f"Warning: Could not write worker status: {e}")
+
+
+def read_worker_statuses() -> List[dict]:
+    """Collect the status reported by every worker sharing this vector_stores directory"""
+    statuses = []
+    if not os.path.isdir(settings.WORKER_STATUS_PATH):
+        return statuses
+    stale_after = max(30.0, settings.SNAPSHOT_POLL_INTERVAL * SnapshotWatcher.HEARTBEAT_EVERY * 3)
+    pointer = read_pointer()
+    published = pointer["snapshot"] if pointer else None
+    now = time.time()
+    for name in sorted(os.listdir(settings.WORKER_STATUS_PATH)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.WORKER_STATUS_PATH, name), "r") as f:
+                status = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        status["stale"] = now - status.get("heartbeat_at", 0) > stale_after
+        status["published_snapshot"] = published
+        status["up_to_date"] = status.get("loaded_snapshot") in (None, published)
+        statuses.append(status)
+    return statuses
+
+
+# Global snapshot watcher instance (one per worker process)
+snapshot_watcher = SnapshotWatcher()
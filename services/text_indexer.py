@@ -0,0 +1,102 @@
+import os
+from contextlib import nullcontext
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.vectorstores import FAISS as LangchainFAISS
+
+from config.settings import settings
+
+# multilingual-e5 models are trained with these prefixes; embeddings without them
+# are noticeably worse for retrieval
+PASSAGE_PREFIX = "passage: "
+QUERY_PREFIX = "query: "
+
+
+class E5Embeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that adds the e5 'passage:' / 'query:' prefixes"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return super().embed_documents([PASSAGE_PREFIX + text for text in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return super().embed_query(QUERY_PREFIX + text)
+
+
+def create_e5_embeddings(batch_size: int = settings.TEXT_EMBEDDING_BATCH_SIZE) -> E5Embeddings:
+    return E5Embeddings(
+        model_name=settings.TEXT_EMBEDDING_MODEL,
+        encode_kwargs={"batch_size": batch_size}
+    )
+
+
+def product_text(product: dict) -> str:
+    return f"Name: {product['name']}\nDescription: {product['description']}\nPrice: {product['price']}\nMarginal Price: {product['marginal_price']}\nCode: {product['code']}\nLink: {product['link']}"
+
+
+def iter_product_documents(products: Iterable[dict]) -> Iterator[Tuple[str, dict]]:
+    """Lazily yield (page_content, metadata) per product instead of building every string up front"""
+    for product in products:
+        yield product_text(product), product
+
+
+def iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def default_workers() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def build_text_index(
+    products: Iterable[dict],
+    embeddings: E5Embeddings,
+    batch_size: int = settings.TEXT_EMBEDDING_BATCH_SIZE,
+    workers: int = 1,
+    chunk_size: int = settings.TEXT_INDEX_CHUNK_SIZE,
+    profiler=None,
+) -> LangchainFAISS:
+    """
+    Stream product documents through the e5 encoder in chunks and add them to a FAISS store.
+    With workers > 1 each chunk is encoded by a pool of sentence-transformers processes,
+    one per core; the pool is started once and reused for every chunk.
+    """
+    stage = profiler.stage if profiler is not None else (lambda *args, **kwargs: nullcontext())
+    model = embeddings.client
+    pool = model.start_multi_process_pool(target_devices=["cpu"] * workers) if workers > 1 else None
+
+    vector_store = None
+    try:
+        for chunk in iter_chunks(iter_product_documents(products), chunk_size):
+            texts = [text for text, _ in chunk]
+            metadatas = [metadata for _, metadata in chunk]
+
+            with stage("text_embedding", items=len(texts), batch_size=batch_size):
+                if pool is not None:
+                    vectors = model.encode_multi_process(
+                        [PASSAGE_PREFIX + text for text in texts],
+                        pool,
+                        batch_size=batch_size,
+                        chunk_size=max(1, len(texts) // workers),
+                    ).tolist()
+                else:
+                    vectors = embeddings.embed_documents(texts)
+
+            with stage("text_faiss_add", items=len(texts)):
+                if vector_store is None:
+                    vector_store = LangchainFAISS.from_embeddings(
+                        list(zip(texts, vectors)), embeddings, metadatas=metadatas
+                    )
+                else:
+                    vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+    return vector_store
@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from config.settings import settings
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children, in MB"""
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+
+class TrainingProfiler:
+    """
+    Collects per-stage wall/CPU time, throughput, batch sizes and peak RSS for a
+    training run, plus the slowest images, and writes them as a JSON report.
+    Stages may be entered many times (e.g. "yolo" once per image); times accumulate.
+    """
+
+    def __init__(self, slowest_n: int = settings.TRAINING_REPORT_SLOWEST_N):
+        self.started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.stages = {}
+        self.slowest_n = slowest_n
+        self._slowest = []  # min-heap of (seconds, seq, path, detail)
+        self._seq = itertools.count()
+
+    def _stage(self, name: str) -> dict:
+        if name not in self.stages:
+            self.stages[name] = {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0, "items": 0, "batch_sizes": []}
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0, batch_size: Optional[int] = None):
+        """Time one execution of a stage. `items` is used to compute throughput."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = self._stage(name)
+            record["wall_s"] += time.perf_counter() - wall
+            record["cpu_s"] += time.process_time() - cpu
+            record["calls"] += 1
+            record["items"] += items
+            if batch_size is not None:
+                record["batch_sizes"].append(batch_size)
+            record["peak_rss_mb"] = peak_rss_mb()
+
+    def record_image(self, image_path: str, seconds: float, detail: dict):
+        """Keep the slowest N images seen so far"""
+        entry = (seconds, next(self._seq), image_path, detail)
+        if len(self._slowest) < self.slowest_n:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def report(self, stats: dict, **extra) -> dict:
+        stages = {}
+        for name, record in self.stages.items():
+            batch_sizes = record["batch_sizes"]
+            stages[name] = {
+                "wall_s": round(record["wall_s"], 4),
+                "cpu_s": round(record["cpu_s"], 4),
+                "calls": record["calls"],
+                "items": record["items"],
+                "items_per_s": round(record["items"] / record["wall_s"], 2) if record["wall_s"] > 0 and record["items"] else None,
+                "batch_size": {
+                    "min": min(batch_sizes),
+                    "max": max(batch_sizes),
+                    "mean": round(sum(batch_sizes) / len(batch_sizes), 2),
+                } if batch_sizes else None,
+                "peak_rss_mb": record.get("peak_rss_mb"),
+            }
+
+        # Exact duplicates are counted in total_images but never reach the detector
+        embedded = stats.get("object_detected", 0) + stats.get("fallback_used", 0)
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "total_wall_s": round(time.perf_counter() - self._wall_start, 4),
+            "total_cpu_s": round(time.process_time() - self._cpu_start, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stats": stats,
+            "detector_hit_rate": round(stats.get("object_detected", 0) / embedded, 4) if embedded else None,
+            "stages": stages,
+            "slowest_images": [
+                {"image_path": path, "seconds": round(seconds, 4), **detail}
+                for seconds, _, path, detail in sorted(self._slowest, reverse=True)
+            ],
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            **extra,
+        }
+
+
+def load_previous_report() -> Optional[dict]:
+    reports = list_reports()
+    if not reports:
+        return None
+    with open(reports[-1], "r") as f:
+        return json.load(f)
+
+
+def list_reports():
+    if not os.path.isdir(settings.TRAINING_REPORTS_PATH):
+        return []
+    return sorted(
+        os.path.join(settings.TRAINING_REPORTS_PATH, name)
+        for name in os.listdir(settings.TRAINING_REPORTS_PATH)
+        if name.startswith("training-") and name.endswith(".json")
+    )
+
+
+def compare_reports(current: dict, previous: dict, threshold: float = 0.2) -> list:
+    """List stages whose per-item (or total) wall time grew by more than `threshold`"""
+    regressions = []
+    for name, stage in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before:
+            continue
+        now_cost = stage["wall_s"] / stage["items"] if stage["items"] else stage["wall_s"]
+        before_cost = before["wall_s"] / before["items"] if before.get("items") else before["wall_s"]
+        if before_cost > 0 and now_cost > before_cost * (1 + threshold):
+            regressions.append({
+                "stage": name,
+                "previous": round(before_cost, 4),
+                "current": round(now_cost, 4),
+                "change_pct": round((now_cost / before_cost - 1) * 100, 1),
+            })
+    return regressions
+
+
+def save_report(report: dict) -> str:
+    """Write the report next to the previous runs' reports, pruning the oldest ones"""
+    previous = load_previous_report()
+    if previous:
+        report["regressions_vs_previous"] = compare_reports(report, previous)
+
+    os.makedirs(settings.TRAINING_REPORTS_PATH, exist_ok=True)
+    name = time.strftime("training-%Y%m%d-%H%M%S", time.localtime(report["started_at"])) + ".json"
+    path = os.path.join(settings.TRAINING_REPORTS_PATH, name)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    for old in list_reports()[:-settings.TRAINING_REPORTS_TO_KEEP]:
+        os.remove(old)
+    return path
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, List, Optional
+
+from config.settings import settings
+from services.metrics import percentile
+
+
+class WebhookQueue:
+    """
+    Background work queue for the Messenger webhook.
+    The webhook only validates, deduplicates and enqueues, then acks Facebook right
+    away; a fixed pool of `workers` consumers runs the jobs (attachment downloads,
+    the chat turn, sending the reply), which also caps how many run at once.
+    Depth, lag (enqueued -> started) and processing time are kept for the metrics.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.WEBHOOK_WORKERS,
+        max_size: int = settings.WEBHOOK_QUEUE_MAX_SIZE,
+        window: int = 1000,
+    ):
+        self.workers = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.max_depth = 0
+        self.lags = deque(maxlen=window)
+        self.durations = deque(maxlen=window)
+        self.stats = Counter()
+
+    async def start(self):
+        if self._consumers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._consumers = [asyncio.create_task(self._consume(i)) for i in range(self.workers)]
+        print(f"OK: Webhook queue started with {self.workers} consumers")
+
+    def submit(self, kind: str, job: Callable[..., Awaitable], *args) -> bool:
+        """Enqueue `job(*args)` without waiting; returns False if the queue is full or not running"""
+        if self._queue is None:
+            print(f"Webhook queue not running, dropping {kind} job")
+            self.stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait((kind, job, args, time.monotonic()))
+        except asyncio.QueueFull:
+            print(f"Webhook queue full ({self.max_size}), dropping {kind} job")
+            self.stats["dropped"] += 1
+            return False
+        self.stats[f"enqueued_{kind}"] += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _consume(self, worker: int):
+        while True:
+            kind, job, args, enqueued_at = await self._queue.get()
+            started = time.monotonic()
+            self.lags.append(started - enqueued_at)
+            self.in_flight += 1
+            try:
+                await job(*args)
+                self.stats[f"processed_{kind}"] += 1
+            except Exception as e:
+                self.stats[f"errors_{kind}"] += 1
+                print(f"Error in webhook {kind} job: {e}")
+            finally:
+                self.in_flight -= 1
+                self.durations.append(time.monotonic() - started)
+                self._queue.task_done()
+
+    async def join(self, timeout: float = settings.WEBHOOK_SHUTDOWN_TIMEOUT):
+        """Wait until every queued job has run, at most `timeout` seconds"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Webhook queue still had {self._queue.qsize()} jobs after {timeout}s")
+
+    async def stop(self, timeout: float = settings.WEBHOOK_SHUTDOWN_TIMEOUT):
+        """Finish queued jobs (up to `timeout`), then stop the consumers"""
+        await self.join(timeout)
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        self._queue = None
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "lag_p50_s": percentile(self.lags, 50),
+            "lag_p95_s": percentile(self.lags, 95),
+            "processing_p50_s": percentile(self.durations, 50),
+            "processing_p95_s": percentile(self.durations, 95),
+        }
+
+
+# Global webhook queue instance; consumers are started with the app
+webhook_queue = WebhookQueue()
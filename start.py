@@ -66,12 +66,14 @@ def check_health():
     
     # Check if vector stores exist
     import os
-    if os.path.exists(settings.IMAGE_FAISS_PATH):
+    from services.index_snapshots import get_index_paths
+    image_path, text_path = get_index_paths()
+    if os.path.exists(image_path):
         print("✓ Image vector store found")
     else:
         print("⚠️  Image vector store not found - run training first")
     
-    if os.path.exists(settings.TEXT_FAISS_PATH):
+    if os.path.exists(text_path):
         print("✓ Text vector store found")
     else:
         print("⚠️  Text vector store not found - run training first")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the webhook message id dedup cache
+"""
+
+import asyncio
+
+from services import dedup_cache
+from services.dedup_cache import DedupCache
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def seen(cache: DedupCache, mid: str) -> bool:
+    return asyncio.run(cache.check_and_add(mid))
+
+
+def test_redelivery_within_ttl_is_a_duplicate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_cache.time, "time", clock.time)
+    cache = DedupCache(max_entries=100, ttl=60, sqlite_path=None)
+
+    assert seen(cache, "m1") is False
+    clock.now += 59
+    assert seen(cache, "m1") is True
+
+
+def test_id_expires_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_cache.time, "time", clock.time)
+    cache = DedupCache(max_entries=100, ttl=60, sqlite_path=None)
+
+    seen(cache, "m1")
+    clock.now += 61
+    assert seen(cache, "m1") is False
+    assert cache.stats["expired"] == 1
+
+
+def test_oldest_id_is_evicted_beyond_max_entries():
+    cache = DedupCache(max_entries=2, ttl=60, sqlite_path=None)
+    for mid in ("m1", "m2", "m3"):
+        seen(cache, mid)
+
+    assert cache.get_stats()["size"] == 2
+    assert seen(cache, "m3") is True
+    assert seen(cache, "m1") is False
+
+
+def test_shared_table_catches_redelivery_on_another_worker(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_cache.time, "time", clock.time)
+    path = str(tmp_path / "dedup.db")
+    worker_a = DedupCache(max_entries=100, ttl=60, sqlite_path=path)
+    worker_b = DedupCache(max_entries=100, ttl=60, sqlite_path=path)
+
+    assert seen(worker_a, "m1") is False
+    assert seen(worker_b, "m1") is True
+    clock.now += 61
+    assert seen(worker_b, "m1") is False  # the expired row is taken over
+    worker_a.close()
+    worker_b.close()
+
+
+def test_concurrent_redelivery_is_caught_while_the_shared_check_runs(tmp_path):
+    cache = DedupCache(max_entries=100, ttl=60, sqlite_path=str(tmp_path / "dedup.db"))
+
+    async def two_deliveries():
+        return await asyncio.gather(cache.check_and_add("m1"), cache.check_and_add("m1"))
+
+    assert sorted(asyncio.run(two_deliveries())) == [False, True]
+    assert cache.stats["hits"] + cache.stats["shared_hits"] == 1
+    cache.close()
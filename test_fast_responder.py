@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the fast responder: only sure intents skip the LLM
+"""
+
+import pytest
+
+from services.fast_responder import IMAGE_ONLY_QUERY, FastResponder
+from services.intent_detector import intent_detector
+
+PRODUCTS = [{"id": 1, "name": "Baby Frock", "price": 850, "description": "Cotton, 2 colours"}]
+SHOES = [{"id": 2, "name": "Baby Shoe", "price": 650, "description": "size: 20-25"}]
+
+
+def respond(message: str, has_images: bool = False, first_message: bool = False, products=PRODUCTS):
+    intents = intent_detector.detect_intents(message, has_images=has_images)
+    reply = FastResponder(enabled=True).respond(
+        message, intents, products, has_images=has_images, first_message=first_message
+    )
+    return reply[1] if reply else None
+
+
+@pytest.mark.parametrize("message", [
+    "আর কিছু লাগবে না, ধন্যবাদ",  # thanks, nothing else: not a cancellation
+    "ok thanks, lagbe na",
+    "কত দিন লাগবে",  # delivery time, not the price
+    "taka ki age dite hobe?",  # advance payment, not the price
+    "price ta ektu komano jabe na?",  # bargaining needs the LLM's instructions
+    "color change kora jabe?",  # another colour, not the return policy
+    "ধানমন্ডি এলাকা",  # an address, not a delivery charge question
+])
+def test_single_weak_keyword_falls_through_to_llm(message):
+    assert respond(message) is None
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("দাম কত?", "price_inquiry"),
+    ("price koto", "price_inquiry"),
+    ("কত টাকা", "price_inquiry"),
+    ("delivery charge koto?", "delivery_inquiry"),
+    ("return policy ki?", "return_policy"),
+    ("size chart", "size_chart"),
+    ("অর্ডারটা ক্যান্সেল করে দিন, লাগবে না", "cancel_order"),
+])
+def test_sure_intents_are_answered(message, intent):
+    assert respond(message) == intent
+
+
+def test_image_only_message_gets_the_price():
+    assert respond(IMAGE_ONLY_QUERY, has_images=True) == "price_inquiry"
+
+
+@pytest.mark.parametrize("message", [IMAGE_ONLY_QUERY, "দাম কত?"])
+def test_shoe_price_goes_to_llm_for_its_description(message):
+    # The product_details rule quotes shoes and sized products with their description
+    assert respond(message, has_images=message == IMAGE_ONLY_QUERY, products=SHOES) is None
+
+
+def test_phone_number_always_goes_to_llm():
+    intents = intent_detector.detect_intents("দাম কত")
+    assert FastResponder(enabled=True).respond("দাম কত", intents, PRODUCTS, has_phone=True) is None
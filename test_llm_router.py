@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM router's hedging, using fake providers instead of real models
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import settings
+from services.llm_router import LLMRouter
+
+
+class FakePrompt:
+    async def ainvoke(self, inputs):
+        return inputs["user_query"]
+
+
+class FakeLLM:
+    """Streams `chunks` after `first_token_delay`, then one chunk every `chunk_delay` seconds"""
+
+    def __init__(self, chunks, first_token_delay=0.0, chunk_delay=0.0, error=None):
+        self.chunks = chunks
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.error = error
+
+    async def astream(self, prompt_value):
+        await asyncio.sleep(self.first_token_delay)
+        if self.error is not None:
+            raise self.error
+        for i, text in enumerate(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield SimpleNamespace(content=text, usage_metadata=None)
+
+
+def make_router(primary: FakeLLM, fallback: FakeLLM) -> LLMRouter:
+    return LLMRouter([("primary", lambda: primary), ("fallback", lambda: fallback)], hedging=True)
+
+
+@pytest.fixture
+def hedge_after_200ms(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1000)
+
+
+def test_ainvoke_does_not_hedge_a_slow_but_streaming_primary(hedge_after_200ms):
+    # First token after 50 ms, but the whole answer takes ~450 ms: past the 200 ms deadline
+    primary = FakeLLM(["a", "b", "c", "d"], first_token_delay=0.05, chunk_delay=0.13)
+    fallback = FakeLLM(["fallback"])
+    router = make_router(primary, fallback)
+
+    text, provider = asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+
+    assert (text, provider) == ("abcd", "primary")
+    assert router.hedges_fired == 0
+    assert router.providers[1].calls == 0
+
+
+def test_astream_does_not_hedge_a_slow_but_streaming_primary(hedge_after_200ms):
+    primary = FakeLLM(["a", "b", "c", "d"], first_token_delay=0.05, chunk_delay=0.13)
+    router = make_router(primary, FakeLLM(["fallback"]))
+
+    async def collect():
+        return [item async for item in router.astream(FakePrompt(), {"user_query": "hi"})]
+
+    assert [name for name, _ in asyncio.run(collect())] == ["primary"] * 4
+    assert router.hedges_fired == 0
+
+
+def test_ainvoke_hedges_when_primary_has_no_first_token(hedge_after_200ms):
+    primary = FakeLLM(["slow"], first_token_delay=1.0)
+    fallback = FakeLLM(["fast"])
+    router = make_router(primary, fallback)
+
+    text, provider = asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+
+    assert (text, provider) == ("fast", "fallback")
+    assert router.hedges_fired == 1
+    assert router.hedge_wins == 1
+    assert router.providers[0].cancelled == 1
+
+
+@pytest.fixture
+def circuit_after_two_failures(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_COOLDOWN", 60.0)
+
+
+def test_failing_primary_hands_over_to_fallback(circuit_after_two_failures):
+    router = make_router(FakeLLM([], error=ConnectionError("down")), FakeLLM(["ok"]))
+
+    text, provider = asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+
+    assert (text, provider) == ("ok", "fallback")
+    assert router.fallback_used == 1
+    assert router.providers[0].errors["ConnectionError"] == 1
+
+
+def test_circuit_opens_after_consecutive_failures_and_skips_the_primary(circuit_after_two_failures):
+    router = make_router(FakeLLM([], error=ConnectionError("down")), FakeLLM(["ok"]))
+
+    async def three_requests():
+        for _ in range(3):
+            await router.ainvoke(FakePrompt(), {"user_query": "hi"})
+
+    asyncio.run(three_requests())
+
+    primary = router.providers[0]
+    assert primary.calls == 2  # the third request skipped it
+    assert router.get_stats()["providers"]["primary"]["circuit"] == "open"
+
+
+def test_half_open_circuit_closes_after_a_successful_trial(circuit_after_two_failures):
+    primary = FakeLLM([], error=ConnectionError("down"))
+    router = make_router(primary, FakeLLM(["fallback"]))
+
+    async def scenario():
+        for _ in range(2):
+            await router.ainvoke(FakePrompt(), {"user_query": "hi"})
+        router.providers[0].open_until = 0.0  # cool-down over
+        primary.error = None
+        primary.chunks = ["recovered"]
+        return await router.ainvoke(FakePrompt(), {"user_query": "hi"})
+
+    assert asyncio.run(scenario()) == ("recovered", "primary")
+    assert router.get_stats()["providers"]["primary"]["circuit"] == "closed"
+
+
+def test_every_provider_failing_raises_the_last_error(circuit_after_two_failures):
+    router = make_router(FakeLLM([], error=ConnectionError("down")), FakeLLM([], error=TimeoutError("slow")))
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+    assert router.failed_requests == 1
+
+
+def test_circuit_opens_for_a_hung_primary_that_keeps_losing_hedges(hedge_after_200ms, circuit_after_two_failures):
+    primary = FakeLLM(["never"], first_token_delay=60.0)
+    router = make_router(primary, FakeLLM(["ok"]))
+
+    async def requests(count):
+        return [await router.ainvoke(FakePrompt(), {"user_query": "hi"}) for _ in range(count)]
+
+    results = asyncio.run(requests(settings.LLM_CIRCUIT_FAILURE_THRESHOLD + 1))
+
+    assert all(result == ("ok", "fallback") for result in results)
+    stats = router.get_stats()
+    assert stats["providers"]["primary"]["circuit"] == "open"
+    assert stats["providers"]["primary"]["errors"] == {"TimeoutError": settings.LLM_CIRCUIT_FAILURE_THRESHOLD}
+    # Once the circuit is open the fallback is asked directly, without waiting for a hedge
+    assert router.providers[0].calls == settings.LLM_CIRCUIT_FAILURE_THRESHOLD
+    assert router.hedges_fired == settings.LLM_CIRCUIT_FAILURE_THRESHOLD
+
+
+def test_streaming_loser_and_disconnect_do_not_count_as_failures(hedge_after_200ms, circuit_after_two_failures):
+    # The primary is hedged, then starts streaming, but the fallback completes first
+    primary = FakeLLM(["a", "b"], first_token_delay=0.3, chunk_delay=1.0)
+    router = make_router(primary, FakeLLM(["ok"], first_token_delay=0.15))
+    asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+
+    async def disconnect():
+        stream = router.astream(FakePrompt(), {"user_query": "hi"})
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(disconnect())
+    assert router.providers[0].failures == 0
+
+
+def test_ainvoke_logs_the_time_to_first_token_not_the_completion_time(capsys):
+    primary = FakeLLM(["a", "b", "c"], first_token_delay=0.05, chunk_delay=0.15)
+    router = make_router(primary, FakeLLM(["fallback"]))
+
+    asyncio.run(router.ainvoke(FakePrompt(), {"user_query": "hi"}))
+
+    line = next(line for line in capsys.readouterr().out.splitlines() if line.startswith("LLM request"))
+    first_token = float(line.split("first_token=")[1].split("s ")[0])
+    total = float(line.split("total=")[1].split("s ")[0])
+    assert first_token < 0.15 < total
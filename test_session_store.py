@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the session store's versioned saves: a turn finished by another worker
+in the meantime is never overwritten
+"""
+
+import asyncio
+
+from services.session_store import MemorySessionBackend, Session, SessionStore, SQLiteSessionBackend
+
+
+def add_turn(session: Session, text: str):
+    session.message_count += 1
+    session.memory.save_turn(text, f"reply to {text}")
+
+
+def replay_of(text: str):
+    return lambda latest: add_turn(latest, text)
+
+
+def user_messages(session: Session):
+    return [user for user, _, _ in session.memory.turns]
+
+
+def test_sqlite_concurrent_turns_from_two_workers_are_both_kept(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SessionStore(SQLiteSessionBackend(path, max_sessions=100, idle_ttl=3600))
+    worker_b = SessionStore(SQLiteSessionBackend(path, max_sessions=100, idle_ttl=3600))
+
+    async def scenario():
+        first = await worker_a.load("sender")
+        add_turn(first, "hello")
+        await worker_a.save("sender", first, replay_of("hello"))
+
+        # Both workers start a turn from the same stored version
+        on_a = await worker_a.load("sender")
+        on_b = await worker_b.load("sender")
+        assert on_a.version == on_b.version == 1
+        add_turn(on_a, "দাম কত")
+        add_turn(on_b, "size 22")
+        await worker_a.save("sender", on_a, replay_of("দাম কত"))
+        saved = await worker_b.save("sender", on_b, replay_of("size 22"))
+        return saved, await worker_a.load("sender")
+
+    saved, stored = asyncio.run(scenario())
+
+    assert user_messages(stored) == ["hello", "দাম কত", "size 22"]
+    assert stored.message_count == 3
+    assert stored.version == saved.version == 3
+    assert worker_b.stats["replayed"] == 1
+    assert worker_b.backend.stats["conflicts"] == 1
+
+
+def test_sqlite_new_session_created_twice_keeps_both_turns(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SessionStore(SQLiteSessionBackend(path, max_sessions=100, idle_ttl=3600))
+    worker_b = SessionStore(SQLiteSessionBackend(path, max_sessions=100, idle_ttl=3600))
+
+    async def scenario():
+        on_a = await worker_a.load("new")
+        on_b = await worker_b.load("new")
+        add_turn(on_a, "hi")
+        add_turn(on_b, "price")
+        await worker_a.save("new", on_a, replay_of("hi"))
+        await worker_b.save("new", on_b, replay_of("price"))
+        return await worker_a.load("new")
+
+    assert user_messages(asyncio.run(scenario())) == ["hi", "price"]
+
+
+def test_memory_backend_rejects_a_stale_version():
+    backend = MemorySessionBackend(max_sessions=100, idle_ttl=3600)
+    session = Session()
+    assert backend.save("s", session, if_version=0)
+    assert session.version == 1
+
+    assert not backend.save("s", Session(), if_version=0)
+    assert backend.save("s", session, if_version=1)
+    assert backend.stats["conflicts"] == 1
@@ -1,142 +1,436 @@
+import argparse
+import hashlib
+import io
 import json
 import os
+import shutil
+import time
 import faiss
 import numpy as np
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import torch
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.docstore.document import Document
-import requests
 from ultralytics import YOLO
 
-# Load product data
-with open('data/products.json', 'r') as f:
-    products = json.load(f)
+from config.settings import settings
+from services.index_snapshots import create_snapshot_dir, publish_snapshot
+from services.training_profiler import TrainingProfiler, save_report
+from services.text_indexer import build_text_index, create_e5_embeddings, default_workers
+
+TARGET_CLASSES = {24, 26, 28}  # backpack (24), handbag (26), suitcase (28)
+CHECKPOINT_DIR = settings.TRAINING_CHECKPOINT_PATH
+CHECKPOINT_STATE = os.path.join(CHECKPOINT_DIR, "state.json")
+CHECKPOINT_FORMAT = 3  # 3: state.json records batch_size
+
+
+def products_fingerprint(products) -> str:
+    """Hash of the product data, so a checkpoint is never resumed against a different catalogue"""
+    payload = json.dumps(products, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def new_stats() -> dict:
+    return {
+        "total_images": 0,
+        "object_detected": 0,
+        "fallback_used": 0,
+        "skipped": 0,
+        "exact_duplicates": 0,
+        "near_duplicates": 0
+    }
+
+
+# --- Checkpointing ---
+
+def new_progress() -> dict:
+    """
+    Image indexing progress. embeddings/metadata/sources/hashes are parallel lists (one
+    entry per stored vector); merges records exact duplicates as [vector_pos, product, image_path].
+    """
+    return {"embeddings": [], "metadata": [], "sources": [], "hashes": [], "merges": []}
+
+
+def load_checkpoint(fingerprint: str):
+    """
+    Load a previous run's progress. Returns (state, progress) or None.
+    Embeddings are stored as one shard per completed batch, so only shards listed
+    in state.json (i.e. fully written before the crash) are read back.
+    """
+    try:
+        with open(CHECKPOINT_STATE, "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if state.get("fingerprint") != fingerprint:
+        print("Checkpoint belongs to a different products.json, ignoring it.")
+        return None
+    if state.get("format") != CHECKPOINT_FORMAT:
+        print("Checkpoint was written by an older version of training.py, ignoring it.")
+        return None
+
+    progress = new_progress()
+    for batch_no in range(state["completed_batches"]):
+        shard = os.path.join(CHECKPOINT_DIR, f"batch_{batch_no:05d}")
+        progress["embeddings"].extend(np.load(f"{shard}.npy"))
+        with open(f"{shard}.json", "r") as f:
+            batch = json.load(f)
+        for key in ("metadata", "sources", "hashes", "merges"):
+            progress[key].extend(batch[key])
+    return state, progress
+
+
+def save_checkpoint(state: dict, batch_no: int, batch: dict):
+    """Write one batch shard, then atomically advance the progress cursor in state.json"""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    shard = os.path.join(CHECKPOINT_DIR, f"batch_{batch_no:05d}")
+    np.save(f"{shard}.npy", np.array(batch["embeddings"], dtype='float32'))
+    with open(f"{shard}.json", "w") as f:
+        json.dump({key: batch[key] for key in ("metadata", "sources", "hashes", "merges")}, f)
+
+    tmp_path = f"{CHECKPOINT_STATE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CHECKPOINT_STATE)
+
+
+def clear_checkpoint():
+    shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
 
-# Create directories for FAISS indexes and metadata
-os.makedirs('vector_stores/image_faiss', exist_ok=True)
-os.makedirs('vector_stores/text_faiss', exist_ok=True)
 
 # --- Image Indexing with YOLO Object Detection ---
 
-# Load YOLO object detector
-object_detector = YOLO("yolov8l.pt")
-TARGET_CLASSES = {24, 26, 28}  # backpack (24), handbag (26), suitcase (28)
+def embed_image(image_path, image_bytes, object_detector, image_model, processor, stats, profiler):
+    """
+    Embed one catalogue image: crop the first target object found, else use the full image.
+    Returns (embedding, detected_class or None).
+    """
+    with profiler.stage("image_decode", items=1):
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+    # Detect objects using YOLO
+    with profiler.stage("yolo", items=1):
+        results = object_detector(image)
+
+    for result in results:
+        boxes = result.boxes
+        if boxes is not None and boxes.shape[0] > 0:  # If objects detected
+            for i in range(boxes.shape[0]):
+                cls = boxes.cls[i].item()  # Class ID
+                if cls in TARGET_CLASSES:
+                    x1, y1, x2, y2 = map(int, boxes.xyxy[i])
+                    cropped_image = image.crop((x1, y1, x2, y2))
+
+                    # Generate embedding for cropped object
+                    with profiler.stage("clip", items=1):
+                        inputs = processor(images=cropped_image, return_tensors="pt")
+                        with torch.no_grad():
+                            embedding = image_model.get_image_features(**inputs)
+                    stats["object_detected"] += 1
+                    print(f"✅ Processed {image_path} with detected object (class {cls})")
+                    return embedding.cpu().numpy().flatten(), cls
+
+    # If no target objects detected, use the entire image as fallback
+    print(f" No target objects detected in {image_path}, using full image")
+    with profiler.stage("clip", items=1):
+        inputs = processor(images=image, return_tensors="pt")
+        with torch.no_grad():
+            embedding = image_model.get_image_features(**inputs)
+    stats["fallback_used"] += 1
+    return embedding.cpu().numpy().flatten(), None
+
+
+def index_images(products, fingerprint, profiler, resume=False, batch_size=settings.TRAINING_BATCH_SIZE):
+    """
+    Embed all product images in batches, checkpointing after every completed batch.
+    Byte-identical images (same content hash) are embedded only once; later copies are
+    recorded as merges into the first vector.
+    """
+    state = {"fingerprint": fingerprint, "format": CHECKPOINT_FORMAT, "batch_size": batch_size,
+             "completed_batches": 0, "stats": new_stats()}
+    progress = new_progress()
+
+    checkpoint = load_checkpoint(fingerprint) if resume else None
+    if checkpoint:
+        state, progress = checkpoint
+        # Batches are slices of the product list; resuming with another size would skip
+        # or re-embed products, so the remaining batches keep the checkpoint's size
+        if state["batch_size"] != batch_size:
+            print(f"Checkpoint was written with --batch-size {state['batch_size']}; "
+                  f"using it instead of {batch_size} for the remaining batches.")
+            batch_size = state["batch_size"]
+        print(f"Resuming from checkpoint: {state['completed_batches']} batches "
+              f"({len(progress['embeddings'])} embeddings) already done.")
+    else:
+        if resume:
+            print("No usable checkpoint found, starting from scratch.")
+        clear_checkpoint()
+    stats = state["stats"]
+    seen_hashes = {content_hash: pos for pos, content_hash in enumerate(progress["hashes"])}
+
+    # Load YOLO object detector and CLIP model
+    with profiler.stage("load_image_models"):
+        object_detector = YOLO("yolov8l.pt")
+        image_model = CLIPModel.from_pretrained(settings.CLIP_MODEL_NAME)
+        processor = CLIPProcessor.from_pretrained(settings.CLIP_MODEL_NAME)
+
+    total_batches = (len(products) + batch_size - 1) // batch_size
+    for batch_no in range(state["completed_batches"], total_batches):
+        batch = new_progress()
+        for product in products[batch_no * batch_size:(batch_no + 1) * batch_size]:
+            # Handle both single image_path and multiple image_paths
+            image_paths = product.get("image_paths", [product.get("image_path")])
+            if isinstance(image_paths, str):
+                image_paths = [image_paths]
+
+            for image_path in image_paths:
+                if not os.path.exists(image_path):
+                    stats["skipped"] += 1
+                    print(f"Image not found: {image_path}")
+                    continue
 
-# Load CLIP model
-image_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-image_embeddings = []
-image_metadata = []
-
-# Statistics tracking
-stats = {
-    "total_images": 0,
-    "object_detected": 0,
-    "fallback_used": 0,
-    "skipped": 0
-}
-
-for product in products:
-    # Handle both single image_path and multiple image_paths
-    image_paths = product.get("image_paths", [product.get("image_path")])
-    if isinstance(image_paths, str):
-        image_paths = [image_paths]
-    
-    for image_path in image_paths:
-        if os.path.exists(image_path):
-            stats["total_images"] += 1
-            image = Image.open(image_path).convert("RGB")
-            target_object_found = False
-            
-            # Detect objects using YOLO
-            results = object_detector(image)
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None and boxes.shape[0] > 0:  # If objects detected
-                    for i in range(boxes.shape[0]):
-                        cls = boxes.cls[i].item()  # Class ID
-                        if cls in TARGET_CLASSES:
-                            x1, y1, x2, y2 = map(int, boxes.xyxy[i])
-                            cropped_image = image.crop((x1, y1, x2, y2))
-                            
-                            # Generate embedding for cropped object
-                            inputs = processor(images=cropped_image, return_tensors="pt")
-                            with torch.no_grad():
-                                embedding = image_model.get_image_features(**inputs)
-                            image_embeddings.append(embedding.cpu().numpy().flatten())
-                            image_metadata.append(product)
-                            target_object_found = True
-                            stats["object_detected"] += 1
-                            print(f"✅ Processed {image_path} with detected object (class {cls})")
-                            break
-                    if target_object_found:
-                        break
-            
-            # If no target objects detected, use the entire image as fallback
-            if not target_object_found:
-                print(f" No target objects detected in {image_path}, using full image")
-                inputs = processor(images=image, return_tensors="pt")
-                with torch.no_grad():
-                    embedding = image_model.get_image_features(**inputs)
-                image_embeddings.append(embedding.cpu().numpy().flatten())
-                image_metadata.append(product)
-                stats["fallback_used"] += 1
-        else:
-            stats["skipped"] += 1
-            print(f"Image not found: {image_path}")
-
-# Create and save image FAISS index
-if image_embeddings:
-    image_embeddings = np.array(image_embeddings).astype('float32')
-    d = image_embeddings.shape[1]
-    image_index = faiss.IndexFlatL2(d)
-    image_index.add(image_embeddings)
-    faiss.write_index(image_index, 'vector_stores/image_faiss/image.index')
+                stats["total_images"] += 1
+                with profiler.stage("hashing", items=1):
+                    with open(image_path, "rb") as f:
+                        image_bytes = f.read()
+                    content_hash = hashlib.sha256(image_bytes).hexdigest()
+
+                if content_hash in seen_hashes:
+                    stats["exact_duplicates"] += 1
+                    batch["merges"].append([seen_hashes[content_hash], product, image_path])
+                    print(f"♻️  {image_path} is identical to an already indexed image, merged")
+                    continue
+
+                started = time.perf_counter()
+                embedding, detected_class = embed_image(
+                    image_path, image_bytes, object_detector, image_model, processor, stats, profiler
+                )
+                profiler.record_image(image_path, time.perf_counter() - started, {
+                    "product_id": product.get("id"),
+                    "detected_class": detected_class,
+                })
+                seen_hashes[content_hash] = len(progress["embeddings"]) + len(batch["embeddings"])
+                batch["embeddings"].append(embedding)
+                batch["metadata"].append(product)
+                batch["sources"].append(image_path)
+                batch["hashes"].append(content_hash)
+
+        for key in progress:
+            progress[key].extend(batch[key])
+        state["completed_batches"] = batch_no + 1
+        with profiler.stage("checkpoint", items=len(batch["embeddings"]), batch_size=len(batch["embeddings"])):
+            save_checkpoint(state, batch_no, batch)
+        print(f"Checkpoint saved: batch {batch_no + 1}/{total_batches}")
+
+    return progress, stats
+
+
+def collapse_duplicates(progress, stats, threshold=settings.IMAGE_DEDUP_SIMILARITY):
+    """
+    Collapse exact duplicates (already detected by content hash) and near duplicates
+    (cosine similarity of CLIP embeddings >= threshold) into one vector each.
+    Every kept vector's metadata gets the list of product_ids it stands for and, under
+    "variants", the records of the other products merged into it (e.g. colour variants
+    with their own price), which serving returns alongside the matched product.
+    Returns (embeddings, metadata, report).
+    """
+    embeddings = np.array(progress["embeddings"], dtype='float32')
+    if len(embeddings) == 0:
+        return [], [], {"groups": []}
+
+    # Greedy clustering in catalogue order: each vector either joins the most similar
+    # representative kept so far or becomes a representative itself
+    normalized = embeddings.copy()
+    faiss.normalize_L2(normalized)
+    representatives = faiss.IndexFlatIP(normalized.shape[1])
+    kept = []  # original positions of representatives
+    owner = {}  # original position -> index into kept
+    near_merges = []
+    for pos in range(len(normalized)):
+        if threshold and representatives.ntotal:
+            similarity, nearest = representatives.search(normalized[pos:pos + 1], 1)
+            if similarity[0][0] >= threshold:
+                owner[pos] = int(nearest[0][0])
+                near_merges.append((pos, float(similarity[0][0])))
+                continue
+        owner[pos] = len(kept)
+        kept.append(pos)
+        representatives.add(normalized[pos:pos + 1])
+
+    groups = [{
+        "kept": {"image_path": progress["sources"][pos], "product_id": progress["metadata"][pos].get("id")},
+        "merged": [],
+        "product_ids": [progress["metadata"][pos].get("id")],
+        "variants": [],
+    } for pos in kept]
+
+    def merge(target, product, image_path, reason, similarity=None):
+        group = groups[target]
+        entry = {"image_path": image_path, "product_id": product.get("id"), "reason": reason}
+        if similarity is not None:
+            entry["similarity"] = round(similarity, 4)
+        group["merged"].append(entry)
+        if product.get("id") not in group["product_ids"]:
+            group["product_ids"].append(product.get("id"))
+            group["variants"].append(product)
+
+    for pos, similarity in near_merges:
+        merge(owner[pos], progress["metadata"][pos], progress["sources"][pos], "near", similarity)
+    for pos, product, image_path in progress["merges"]:
+        merge(owner[pos], product, image_path, "exact")
+
+    metadata = []
+    for pos, group in zip(kept, groups):
+        metadata.append({**progress["metadata"][pos], "product_ids": group["product_ids"], "variants": group.pop("variants")})
+
+    stats["near_duplicates"] = len(near_merges)
+    stats["vectors_after_dedup"] = len(kept)
+    report = {
+        "similarity_threshold": threshold,
+        "images_indexed": stats["total_images"],
+        "vectors": len(kept),
+        "exact_duplicates": stats["exact_duplicates"],
+        "near_duplicates": len(near_merges),
+        "groups": [group for group in groups if group["merged"]],
+    }
+    return [embeddings[pos] for pos in kept], metadata, report
+
+
+def write_image_index(image_embeddings, image_metadata, dedup_report, image_dir, profiler):
+    """Create and save the image FAISS index, its metadata and the dedup report"""
+    with open(os.path.join(image_dir, 'dedup_report.json'), 'w') as f:
+        json.dump(dedup_report, f, indent=2)
+    if not image_embeddings:
+        return
+    with profiler.stage("image_faiss_build", items=len(image_embeddings)):
+        image_embeddings = np.array(image_embeddings).astype('float32')
+        d = image_embeddings.shape[1]
+        image_index = faiss.IndexFlatL2(d)
+        image_index.add(image_embeddings)
+        faiss.write_index(image_index, os.path.join(image_dir, 'image.index'))
 
     # Save image metadata
-    with open('vector_stores/image_faiss/image_metadata.json', 'w') as f:
+    with open(os.path.join(image_dir, 'image_metadata.json'), 'w') as f:
         json.dump(image_metadata, f)
 
+
 # --- Text Indexing (LangChain) ---
 
-# Create documents for LangChain
-documents = []
-for product in products:
-    product_text = f"Name: {product['name']}\nDescription: {product['description']}\nPrice: {product['price']}\nMarginal Price: {product['marginal_price']}\nCode: {product['code']}\nLink: {product['link']}"
-    documents.append(Document(page_content=product_text, metadata=product))
-
-# Create embeddings
-embeddings = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-small")
-
-# Create and save text FAISS vector store
-vector_store = FAISS.from_documents(documents, embeddings)
-vector_store.save_local('vector_stores/text_faiss')
-
-print("Training complete.")
-
-# Print statistics
-print("\n" + "="*50)
-print("TRAINING STATISTICS:")
-print(f"Total images processed: {stats['total_images']}")
-print(f"Images with object detection: {stats['object_detected']} ({stats['object_detected']/max(stats['total_images'],1)*100:.1f}%)")
-print(f"Images using fallback (full image): {stats['fallback_used']} ({stats['fallback_used']/max(stats['total_images'],1)*100:.1f}%)")
-print(f"Images skipped (not found): {stats['skipped']}")
-print(f"Total embeddings created: {len(image_embeddings)}")
-print("="*50)
-
-# --- Reload Models ---
-try:
-    # response = requests.post("http://127.0.0.1:8000/api/reload-models")
-    response = requests.post("https://chat.momsandkidsworld.com/api/reload-models")
-    if response.status_code == 200:
-        print("Models reloaded successfully.")
-    else:
-        print(f"Failed to reload models. Status code: {response.status_code}")
-except requests.exceptions.ConnectionError as e:
-    print(f"Failed to connect to the server: {e}")
-    print("\nTo load the new data into the running application, send a POST request to the /api/reload-models endpoint.")
\ No newline at end of file
+def write_text_index(products, text_dir, profiler, batch_size=settings.TEXT_EMBEDDING_BATCH_SIZE, workers=1):
+    # Create embeddings
+    with profiler.stage("load_text_model"):
+        embeddings = create_e5_embeddings(batch_size=batch_size)
+
+    # Stream documents through the encoder and save the text FAISS vector store
+    print(f"Building text index for {len(products)} products "
+          f"(batch size {batch_size}, {workers} encoder process{'es' if workers > 1 else ''})...")
+    vector_store = build_text_index(products, embeddings, batch_size=batch_size, workers=workers, profiler=profiler)
+    if vector_store is not None:
+        with profiler.stage("text_faiss_save"):
+            vector_store.save_local(text_dir)
+
+
+def print_stats(stats, embeddings_count):
+    print("\n" + "="*50)
+    print("TRAINING STATISTICS:")
+    print(f"Total images processed: {stats['total_images']}")
+    # Exact duplicates never reach YOLO, so rates are over the images actually embedded
+    embedded = max(stats['object_detected'] + stats['fallback_used'], 1)
+    print(f"Images with object detection: {stats['object_detected']} ({stats['object_detected']/embedded*100:.1f}%)")
+    print(f"Images using fallback (full image): {stats['fallback_used']} ({stats['fallback_used']/embedded*100:.1f}%)")
+    print(f"Images skipped (not found): {stats['skipped']}")
+    print(f"Exact duplicates merged: {stats['exact_duplicates']}")
+    print(f"Near duplicates merged: {stats['near_duplicates']}")
+    print(f"Total embeddings created: {embeddings_count}")
+    print("="*50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the image and text FAISS indexes")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the last completed batch of an interrupted run"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.TRAINING_BATCH_SIZE,
+        help=f"Products per checkpointed batch (default: {settings.TRAINING_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--text-batch-size",
+        type=int,
+        default=settings.TEXT_EMBEDDING_BATCH_SIZE,
+        help=f"Encoder batch size for the text index (default: {settings.TEXT_EMBEDDING_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--text-workers",
+        type=int,
+        default=settings.TEXT_EMBEDDING_WORKERS,
+        help="Encoder processes for the text index (default: one per core, up to 4, "
+             f"for catalogues of at least {settings.TEXT_MULTIPROCESS_MIN_DOCS} products, else 1)"
+    )
+    parser.add_argument(
+        "--dedup-similarity",
+        type=float,
+        default=settings.IMAGE_DEDUP_SIMILARITY,
+        help=f"Cosine similarity at which images count as near duplicates, 0 disables (default: {settings.IMAGE_DEDUP_SIMILARITY})"
+    )
+    args = parser.parse_args()
+
+    # Load product data
+    with open(settings.PRODUCTS_JSON_PATH, 'r') as f:
+        products = json.load(f)
+    fingerprint = products_fingerprint(products)
+    profiler = TrainingProfiler()
+
+    progress, stats = index_images(
+        products, fingerprint, profiler, resume=args.resume, batch_size=args.batch_size
+    )
+    with profiler.stage("dedup", items=len(progress["embeddings"])):
+        image_embeddings, image_metadata, dedup_report = collapse_duplicates(
+            progress, stats, threshold=args.dedup_similarity
+        )
+
+    # Write the final indexes into a new snapshot; nothing is visible to the
+    # application until publish_snapshot() switches the pointer below
+    snapshot_dir = create_snapshot_dir()
+    write_image_index(image_embeddings, image_metadata, dedup_report, os.path.join(snapshot_dir, "image_faiss"), profiler)
+    text_workers = args.text_workers
+    if not text_workers:
+        # Only the automatic choice stays single-process for small catalogues; an explicit count is used as given
+        text_workers = default_workers() if len(products) >= settings.TEXT_MULTIPROCESS_MIN_DOCS else 1
+    write_text_index(
+        products, os.path.join(snapshot_dir, "text_faiss"), profiler,
+        batch_size=args.text_batch_size, workers=text_workers
+    )
+
+    pointer = publish_snapshot(snapshot_dir)
+    clear_checkpoint()
+    print(f"Training complete. Published snapshot {pointer['snapshot']}.")
+    print(f"Dedup report written to {os.path.join(snapshot_dir, 'image_faiss', 'dedup_report.json')}")
+
+    print_stats(stats, len(image_embeddings))
+
+    report = profiler.report(
+        stats,
+        snapshot=pointer["snapshot"],
+        resumed=args.resume,
+        products=len(products),
+        image_embeddings=len(image_embeddings),
+    )
+    report_path = save_report(report)
+    print(f"Profiling report written to {report_path}")
+    for regression in report.get("regressions_vs_previous", []):
+        print(f"⚠️  Stage '{regression['stage']}' is {regression['change_pct']}% slower than the previous run")
+
+    # Running workers watch the snapshot pointer and reload by themselves
+    print(f"Running workers will pick up the new snapshot within ~{settings.SNAPSHOT_POLL_INTERVAL:g}s "
+          f"(check GET /api/reload-status).")
+
+
+if __name__ == "__main__":
+    main()